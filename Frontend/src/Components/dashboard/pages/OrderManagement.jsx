@@ -144,33 +144,59 @@ const StatusUpdater = ({ order, statusType, onUpdate }) => {
 
 // --- Main Component ---
 
+// Payment statuses the admin can filter on, matching CartOrder.PAYMENT_STATUS
+const PAYMENT_STATUSES = [
+  "all",
+  "paid",
+  "pending",
+  "processing",
+  "cancelled",
+  "initiated",
+  "failed",
+  "refunding",
+  "refunded",
+  "unpaid",
+  "expired",
+];
+
 const OrderManagement = () => {
   const [allOrders, setAllOrders] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [hasLoaded, setHasLoaded] = useState(false);
   const [error, setError] = useState(null);
   const [searchTerm, setSearchTerm] = useState("");
+  const [debouncedSearch, setDebouncedSearch] = useState("");
   const [statusFilter, setStatusFilter] = useState("all");
   const [expandedOrderId, setExpandedOrderId] = useState(null);
 
   const { currentUser } = useSelector((state) => state.user);
   const isAdmin = currentUser?.role === "admin";
 
+  // Wait for the admin to stop typing before asking the server
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  // The order list is cursor paginated, search and status filtering run on
+  // the server so every page is covered, not only the first one.
   useEffect(() => {
     const fetchOrders = async () => {
       setLoading(true);
       setError(null);
       try {
         const api = createApiClient();
-        const endpoint = "/api/v1/cart/orders/";
-        const response = await api.get(endpoint);
+        const params = { expand: "orderitem.product" };
+        if (debouncedSearch) params.search = debouncedSearch;
+        if (statusFilter !== "all") params.payment_status = statusFilter;
+        const response = await api.get("/api/v1/cart/orders/", { params });
         const ordersData = response.data.results
           ? response.data.results
           : response.data;
-        if (Array.isArray(ordersData)) {
-          setAllOrders(ordersData);
-        } else {
-          setAllOrders([]);
-        }
+        setAllOrders(Array.isArray(ordersData) ? ordersData : []);
+        setNextPage(response.data.next || null);
       } catch (err) {
         const errorMessage =
           err.response?.data?.detail || "Failed to fetch orders.";
@@ -178,40 +204,27 @@ const OrderManagement = () => {
         toast.error(errorMessage);
       } finally {
         setLoading(false);
+        setHasLoaded(true);
       }
     };
     fetchOrders();
-  }, [isAdmin]);
+  }, [isAdmin, debouncedSearch, statusFilter]);
 
-  const filteredOrders = useMemo(() => {
-    if (!Array.isArray(allOrders)) return [];
-    return allOrders
-      .filter((order) => {
-        if (
-          statusFilter !== "all" &&
-          order.payment_status.toLowerCase() !== statusFilter
-        ) {
-          return false;
-        }
-        return true;
-      })
-      .filter((order) => {
-        if (searchTerm.trim() === "") return true;
-        const lowercasedSearch = searchTerm.toLowerCase();
-        return (
-          order.oid.toLowerCase().includes(lowercasedSearch) ||
-          order.full_name.toLowerCase().includes(lowercasedSearch)
-        );
-      });
-  }, [allOrders, searchTerm, statusFilter]);
-
-  const paymentStatuses = useMemo(() => {
-    if (!Array.isArray(allOrders)) return ["all"];
-    return [
-      "all",
-      ...new Set(allOrders.map((o) => o.payment_status.toLowerCase())),
-    ];
-  }, [allOrders]);
+  const handleLoadMore = async () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const api = createApiClient();
+      // `next` is an absolute URL that already carries the cursor and filters
+      const response = await api.get(nextPage);
+      setAllOrders((prevOrders) => [...prevOrders, ...response.data.results]);
+      setNextPage(response.data.next || null);
+    } catch (err) {
+      toast.error(err.response?.data?.detail || "Failed to load more orders.");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const handleToggleExpand = (orderId) => {
     setExpandedOrderId(expandedOrderId === orderId ? null : orderId);
@@ -225,7 +238,7 @@ const OrderManagement = () => {
     );
   };
 
-  if (loading)
+  if (loading && !hasLoaded)
     return (
       <div className="p-10">
         <Loader2 className="h-10 w-10 animate-spin text-indigo-600 mx-auto" />
@@ -271,7 +284,7 @@ const OrderManagement = () => {
                   onChange={(e) => setStatusFilter(e.target.value)}
                   className="pl-10 pr-4 py-2 border border-gray-300 rounded-md shadow-sm focus:ring-indigo-500 focus:border-indigo-500 appearance-none"
                 >
-                  {paymentStatuses.map((status) => (
+                  {PAYMENT_STATUSES.map((status) => (
                     <option key={status} value={status}>
                       {status.charAt(0).toUpperCase() + status.slice(1)}
                     </option>
@@ -284,7 +297,7 @@ const OrderManagement = () => {
         <div className="mt-8 flow-root">
           <div className="-mx-4 -my-2 overflow-x-auto sm:-mx-6 lg:-mx-8">
             <div className="inline-block min-w-full py-2 align-middle sm:px-6 lg:px-8">
-              {filteredOrders.length > 0 ? (
+              {allOrders.length > 0 ? (
                 <div className="overflow-hidden shadow ring-1 ring-black ring-opacity-5 sm:rounded-lg">
                   <table className="min-w-full divide-y divide-gray-300">
                     <thead className="bg-gray-50">
@@ -330,7 +343,7 @@ const OrderManagement = () => {
                         </th>
                       </tr>
                     </thead>
-                    {filteredOrders.map((order) => (
+                    {allOrders.map((order) => (
                       <tbody
                         key={order.oid}
                         className="divide-y divide-gray-200 bg-white"
@@ -517,6 +530,21 @@ const OrderManagement = () => {
                       </tbody>
                     ))}
                   </table>
+                  {nextPage && (
+                    <div className="flex justify-center border-t border-gray-200 bg-gray-50 py-4">
+                      <button
+                        type="button"
+                        onClick={handleLoadMore}
+                        disabled={loadingMore}
+                        className="inline-flex items-center gap-2 rounded-md bg-white px-4 py-2 text-sm font-medium text-gray-700 shadow-sm ring-1 ring-inset ring-gray-300 hover:bg-gray-50 disabled:opacity-70 disabled:cursor-not-allowed"
+                      >
+                        {loadingMore && (
+                          <Loader2 className="h-4 w-4 animate-spin text-gray-400" />
+                        )}
+                        Load more orders
+                      </button>
+                    </div>
+                  )}
                 </div>
               ) : (
                 <div className="text-center py-16 bg-white rounded-lg shadow">
@@ -202,7 +202,10 @@ const CheckoutPage = () => {
               createOrder={(data, actions) => {
                 return actions.order.create({
                   purchase_units: [
-                    { amount: { value: Number(order.total).toFixed(2) } },
+                    {
+                      custom_id: order.oid,
+                      amount: { value: Number(order.total).toFixed(2) },
+                    },
                   ],
                 });
               }}
@@ -128,11 +128,11 @@ export const fetchRecentOrders = async () => {
   try {
     const response = await api.get("/api/v1/cart/orders/", {
       params: {
-        ordering: "-date",
         page_size: 5,
+        expand: "orderitem.product",
       },
     });
-    return response.data || [];
+    return response.data?.results || [];
   } catch (error) {
     console.error("Error fetching recent orders:", error);
     throw error;
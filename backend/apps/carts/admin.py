@@ -1,7 +1,19 @@
 from django.contrib import admin
 
-from .models import Cart, CartOrder, CartOrderItem
+from .models import (
+    ArchivedCart,
+    Cart,
+    CartOrder,
+    CartOrderItem,
+    PayPalWebhookEvent,
+    ProductSalesRollup,
+    StockReservation,
+)
 
 admin.site.register(Cart)
 admin.site.register(CartOrder)
 admin.site.register(CartOrderItem)
+admin.site.register(StockReservation)
+admin.site.register(PayPalWebhookEvent)
+admin.site.register(ProductSalesRollup)
+admin.site.register(ArchivedCart)
@@ -6,3 +6,6 @@ class CartsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.carts"
     verbose_name = _("Carts")
+
+    def ready(self):
+        from apps.carts import signals
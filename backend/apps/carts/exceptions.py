@@ -0,0 +1,13 @@
+from rest_framework.exceptions import APIException
+
+
+class InsufficientStock(APIException):
+    status_code = 400
+    default_detail = "Requested quantity exceeds available stock."
+    default_code = "insufficient_stock"
+
+
+class GuestCartLimitExceeded(APIException):
+    status_code = 400
+    default_detail = "Guest cart limit exceeded."
+    default_code = "guest_cart_limit"
@@ -0,0 +1,21 @@
+import django_filters
+from django.db.models import Q
+
+from .models import CartOrder
+
+
+class OrderFilter(django_filters.FilterSet):
+    date_from = django_filters.DateFilter(field_name="date", lookup_expr="date__gte")
+    date_to = django_filters.DateFilter(field_name="date", lookup_expr="date__lte")
+    payment_status = django_filters.MultipleChoiceFilter(
+        choices=CartOrder.PAYMENT_STATUS
+    )
+    order_status = django_filters.MultipleChoiceFilter(choices=CartOrder.ORDER_STATUS)
+    search = django_filters.CharFilter(method="filter_search")
+
+    class Meta:
+        model = CartOrder
+        fields = ["date_from", "date_to", "payment_status", "order_status", "search"]
+
+    def filter_search(self, queryset, name, value):
+        return queryset.filter(Q(oid__icontains=value) | Q(full_name__icontains=value))
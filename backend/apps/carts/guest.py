@@ -0,0 +1,112 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .exceptions import GuestCartLimitExceeded
+
+
+def guest_cart_cache_key(cart_id, *parts):
+    return ":".join(["carts:guest", str(cart_id), *map(str, parts)])
+
+
+class GuestCart:
+    """
+    Cart of an anonymous visitor, kept in the Django cache under its cart_id.
+
+    Each line is its own counter, changed with cache.incr/decr so concurrent
+    requests never overwrite each other. The products in the cart are listed
+    in numbered slots handed out by another counter, one per product. Lines
+    never touch the database. Products are only resolved, and stock only
+    checked, when the cart is merged into a user's cart with
+    Cart.objects.merge_guest_cart().
+    """
+
+    def __init__(self, cart_id=None):
+        self.cart_id = str(cart_id or uuid.uuid4())
+
+    @property
+    def timeout(self):
+        return settings.GUEST_CART_TTL.total_seconds()
+
+    def key(self, *parts):
+        return guest_cart_cache_key(self.cart_id, *parts)
+
+    def slot_keys(self):
+        count = cache.get(self.key("slots"), 0)
+        return [
+            self.key("slot", slot)
+            for slot in range(1, min(count, settings.GUEST_CART_MAX_LINES) + 1)
+        ]
+
+    def product_ids(self):
+        slot_keys = self.slot_keys()
+        slots = cache.get_many(slot_keys)
+        return [slots[key] for key in slot_keys if key in slots]
+
+    def line_keys(self, product_ids):
+        return {self.key("line", product_id): product_id for product_id in product_ids}
+
+    def get_items(self, product_ids=None):
+        if product_ids is None:
+            product_ids = self.product_ids()
+        keys = self.line_keys(product_ids)
+        lines = cache.get_many(keys)
+        return {keys[key]: lines[key] for key in keys if lines.get(key)}
+
+    def add(self, product_id, qty):
+        line_key = self.key("line", product_id)
+        if cache.add(line_key, 0, self.timeout):
+            # First time this product is added, give it a slot
+            cache.add(self.key("slots"), 0, self.timeout)
+            slot = cache.incr(self.key("slots"))
+            if slot > settings.GUEST_CART_MAX_LINES:
+                cache.delete(line_key)
+                raise GuestCartLimitExceeded(
+                    {
+                        "product_id": "A guest cart holds at most "
+                        f"{settings.GUEST_CART_MAX_LINES} products."
+                    }
+                )
+            cache.set(self.key("slot", slot), product_id, self.timeout)
+
+        if cache.incr(line_key, qty) > settings.GUEST_CART_MAX_QTY:
+            cache.decr(line_key, qty)
+            raise GuestCartLimitExceeded(
+                {"qty": f"At most {settings.GUEST_CART_MAX_QTY} of each product."}
+            )
+        return self.touch()
+
+    def remove(self, product_id):
+        # The line keeps its slot at 0, so adding the product again reuses it
+        line_key = self.key("line", product_id)
+        qty = cache.get(line_key)
+        if qty:
+            cache.decr(line_key, qty)
+        return self.touch()
+
+    def touch(self):
+        """
+        Restart the TTL of every key of the cart, so active carts do not
+        expire. Returns the cart's items.
+        """
+        product_ids = self.product_ids()
+        for key in self.all_keys(product_ids):
+            cache.touch(key, self.timeout)
+        return self.get_items(product_ids)
+
+    def clear(self):
+        cache.delete_many(self.all_keys(self.product_ids()))
+
+    def all_keys(self, product_ids):
+        return [self.key("slots"), *self.slot_keys(), *self.line_keys(product_ids)]
+
+    def to_representation(self, items=None):
+        items = self.get_items() if items is None else items
+        return {
+            "cart_id": self.cart_id,
+            "items": [
+                {"product_id": product_id, "qty": qty}
+                for product_id, qty in items.items()
+            ],
+        }
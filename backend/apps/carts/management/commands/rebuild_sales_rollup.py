@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.carts.models import ProductSalesRollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-product sales rollup from every order item"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of products recomputed per query.",
+        )
+
+    def handle(self, *args, **options):
+        refreshed = ProductSalesRollup.objects.rebuild(
+            batch_size=options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt the sales rollup for {refreshed} products.")
+        )
@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.carts.models import CartOrder, CartOrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Repair CartOrder.total and grand_total values that drifted from the "
+        "sum of their items"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of orders repaired per UPDATE statement.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many orders have drifted.",
+        )
+        parser.add_argument(
+            "--sync-delivery",
+            action="store_true",
+            help="Also copy each order's latest delivery courier cost onto it.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        items_total = Coalesce(
+            Subquery(
+                CartOrderItem.objects.filter(order=OuterRef("pk"))
+                .order_by()
+                .values("order")
+                .annotate(total=Sum("total"))
+                .values("total")
+            ),
+            Value(Decimal("0.00")),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+
+        if options["sync_delivery"] and not options["dry_run"]:
+            order_ids = list(
+                CartOrder.objects.order_by("pk").values_list("pk", flat=True)
+            )
+            for start in range(0, len(order_ids), batch_size):
+                CartOrder.objects.sync_delivery_cost(
+                    order_ids[start : start + batch_size]
+                )
+
+        drifted = list(
+            CartOrder.objects.annotate(items_total=items_total)
+            .filter(
+                ~Q(total=F("items_total"))
+                | ~Q(grand_total=F("items_total") + F("delivery_cost"))
+            )
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+        if options["dry_run"]:
+            self.stdout.write(f"{len(drifted)} orders have a drifted total.")
+            return
+
+        for start in range(0, len(drifted), batch_size):
+            CartOrder.objects.filter(pk__in=drifted[start : start + batch_size]).update(
+                total=items_total, grand_total=items_total + F("delivery_cost")
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Recomputed totals for {len(drifted)} orders.")
+        )
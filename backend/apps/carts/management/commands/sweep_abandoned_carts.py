@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.carts.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Archive and delete cart lines unchanged for ABANDONED_CART_MAX_AGE"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Sweep carts unchanged for this many days instead of the setting.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of cart lines removed per transaction.",
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_true",
+            help="Delete without copying the lines to ArchivedCart.",
+        )
+
+    def handle(self, *args, **options):
+        max_age = settings.ABANDONED_CART_MAX_AGE
+        if options["days"] is not None:
+            max_age = timedelta(days=options["days"])
+        archive = settings.ABANDONED_CART_ARCHIVE and not options["no_archive"]
+
+        started = time.monotonic()
+        removed = Cart.objects.sweep_abandoned(
+            timezone.now() - max_age,
+            chunk_size=options["chunk_size"],
+            archive=archive,
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Removed {removed} abandoned cart lines in {elapsed:.2f}s."
+            )
+        )
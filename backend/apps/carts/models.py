@@ -1,13 +1,271 @@
+import logging
+from collections import Counter
 from decimal import Decimal
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from shortuuid.django_fields import ShortUUIDField
 
+from .exceptions import InsufficientStock
+
 User = get_user_model()
 import uuid
 
+logger = logging.getLogger(__name__)
+
+CART_SUMMARY_CACHE_TIMEOUT = 60 * 5
+
+# Orders still waiting for payment, whose delivery cost may be requoted
+REQUOTABLE_PAYMENT_STATUSES = ["initiated", "pending", "processing", "unpaid"]
+
+
+def cart_summary_cache_key(cart_id, user_id=None):
+    return f"carts:summary:{cart_id}:{user_id or 'any'}"
+
+
+PRODUCT_STATS_CACHE_TIMEOUT = 60 * 5
+
+
+def product_stats_cache_key(product_id):
+    return f"carts:product_stats:{product_id}"
+
+
+WISHLIST_IDS_CACHE_TIMEOUT = 60 * 60
+
+
+def wishlist_ids_cache_key(user_id):
+    return f"carts:wishlist_ids:{user_id}"
+
+
+def refresh_product_sales(product_ids):
+    """
+    Recompute the sales rollup and drop the cached sales stats of the given
+    products once the current transaction commits.
+    """
+    if not product_ids:
+        return
+    transaction.on_commit(lambda: ProductSalesRollup.objects.refresh(product_ids))
+    transaction.on_commit(
+        lambda: cache.delete_many([product_stats_cache_key(pk) for pk in product_ids])
+    )
+
+
+def invalidate_cart_summaries(carts):
+    cache.delete_many(
+        [
+            key
+            for cart in carts
+            for key in (
+                cart_summary_cache_key(cart.cart_id),
+                cart_summary_cache_key(cart.cart_id, cart.user_id),
+            )
+        ]
+    )
+
+
+class ProductLineQuerySet(models.QuerySet):
+    def with_product_card(self):
+        """
+        Load everything ProductCardSerializer needs in a fixed number of queries.
+        """
+        return self.select_related("product").prefetch_related(
+            "product__multi_images", "product__tags"
+        )
+
+
+class CartQuerySet(ProductLineQuerySet):
+    def summary(self):
+        """
+        Totals for the carts in this queryset, computed in a single aggregate query.
+        """
+        totals = self.aggregate(
+            total_amount=Coalesce(
+                Sum("total"),
+                Value(Decimal("0.00")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            total_items=Coalesce(Sum("qty"), 0),
+        )
+        return {
+            "total_amount": round(float(totals["total_amount"]), 2),
+            "total_items": totals["total_items"],
+        }
+
+    def add_item(self, user, product, qty):
+        """
+        Add qty of product to the user's cart line, creating it if needed.
+
+        The increment is a single conditional UPDATE guarded by product stock,
+        so concurrent requests can neither lose an increment nor overshoot stock.
+        Returns (cart, created).
+        """
+        line = self.filter(user=user, product=product)
+
+        def increment():
+            return line.filter(qty__lte=F("product__stock") - qty).update(
+                qty=F("qty") + qty,
+                total=(F("qty") + qty) * product.price,
+                updated_at=timezone.now(),
+            )
+
+        updated = increment()
+        if not updated and qty <= product.stock:
+            try:
+                with transaction.atomic():
+                    return self.create(user=user, product=product, qty=qty), True
+            except IntegrityError:
+                # Another request created the line first, increment it instead.
+                updated = increment()
+
+        if not updated:
+            current = line.values_list("qty", flat=True).first() or 0
+            raise InsufficientStock(
+                {
+                    "qty": f"Total quantity {current + qty} exceeds stock {product.stock}."
+                }
+            )
+
+        cart = line.get()
+        cart.invalidate_summary()
+        return cart, False
+
+    def add_items(self, user, items):
+        """
+        Add several (product, qty) pairs to the user's cart in one transaction.
+
+        Existing lines are locked and updated with one bulk UPDATE, new lines are
+        inserted with one bulk INSERT. Nothing is written if any line would
+        exceed stock. Returns the list of affected carts.
+        """
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    carts = self._add_items(user, items)
+                break
+            except IntegrityError:
+                # A concurrent request created one of the lines, retry once
+                # so it is picked up as an existing line.
+                if attempt:
+                    raise
+
+        invalidate_cart_summaries(carts)
+        return carts
+
+    def _add_items(self, user, items):
+        existing = {
+            cart.product_id: cart
+            for cart in self.select_for_update().filter(
+                user=user, product__in=[product for product, _ in items]
+            )
+        }
+
+        now = timezone.now()
+        to_update, to_create, errors = [], [], {}
+        for product, qty in items:
+            cart = existing.get(product.id)
+            new_qty = qty + (cart.qty if cart else 0)
+            if new_qty > product.stock:
+                errors[str(product.id)] = (
+                    f"Total quantity {new_qty} exceeds stock {product.stock}."
+                )
+            elif cart:
+                cart.product = product
+                cart.qty = new_qty
+                cart.total = product.price * new_qty
+                cart.updated_at = now
+                to_update.append(cart)
+            else:
+                to_create.append(
+                    self.model(
+                        user=user,
+                        product=product,
+                        qty=new_qty,
+                        total=product.price * new_qty,
+                    )
+                )
+
+        if errors:
+            raise InsufficientStock({"items": errors})
+
+        self.bulk_update(to_update, ["qty", "total", "updated_at"])
+        self.bulk_create(to_create)
+        return to_update + to_create
+
+    def merge_guest_cart(self, user, guest_cart):
+        """
+        Move a guest cart into the user's cart with one bulk upsert.
+
+        Quantities are added to lines the user already has and capped at the
+        available stock, unknown or unavailable products are dropped. The
+        guest cart is cleared afterwards. Returns the number of lines merged.
+        """
+        items = guest_cart.get_items()
+        if not items:
+            return 0
+
+        Product = self.model._meta.get_field("product").related_model
+        products = Product.objects.filter(is_available=True, stock__gt=0).in_bulk(
+            list(items)
+        )
+        existing = dict(
+            self.filter(user=user, product__in=list(products)).values_list(
+                "product_id", "qty"
+            )
+        )
+        lines = []
+        for product_id, product in products.items():
+            qty = min(existing.get(product_id, 0) + items[product_id], product.stock)
+            lines.append(
+                self.model(
+                    user=user, product=product, qty=qty, total=product.price * qty
+                )
+            )
+
+        merged = self.bulk_create(
+            lines,
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["qty", "total", "updated_at"],
+        )
+        guest_cart.clear()
+        invalidate_cart_summaries(self.filter(user=user))
+        return len(merged)
+
+    def sweep_abandoned(self, older_than, chunk_size=1000, archive=True):
+        """
+        Remove cart lines last changed before older_than, chunk_size rows at
+        a time, copying them to ArchivedCart first when archive is set.
+
+        Every chunk is its own short transaction found through the updated_at
+        index, so the sweep never holds locks on many rows for long.
+        Returns the number of rows removed.
+        """
+        removed = 0
+        while True:
+            with transaction.atomic():
+                chunk = list(
+                    self.filter(updated_at__lt=older_than)
+                    .order_by("updated_at", "pk")
+                    .select_for_update(skip_locked=True)[:chunk_size]
+                )
+                if not chunk:
+                    break
+                if archive:
+                    ArchivedCart.objects.bulk_create(
+                        [ArchivedCart.from_cart(cart) for cart in chunk]
+                    )
+                self.model.objects.filter(pk__in=[cart.pk for cart in chunk]).delete()
+            invalidate_cart_summaries(chunk)
+            removed += len(chunk)
+            if len(chunk) < chunk_size:
+                break
+        return removed
+
 
 class Cart(models.Model):
     product = models.ForeignKey("product.Product", on_delete=models.CASCADE)
@@ -15,7 +273,17 @@ class Cart(models.Model):
     qty = models.PositiveIntegerField(default=1)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     cart_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "product"], name="unique_cart_user_product"
+            )
+        ]
 
     def __str__(self):
         return f"{self.cart_id} - {self.product.product_name}"
@@ -24,11 +292,158 @@ class Cart(models.Model):
         if self.product and self.qty:
             self.total = self.product.price * self.qty
         super().save(*args, **kwargs)
+        self.invalidate_summary()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.invalidate_summary()
+        return result
+
+    @classmethod
+    def get_summary(cls, cart_id, user=None):
+        """
+        Cached totals for a cart, optionally restricted to a single user.
+        """
+        key = cart_summary_cache_key(cart_id, user.pk if user else None)
+        summary = cache.get(key)
+        if summary is None:
+            carts = cls.objects.filter(cart_id=cart_id)
+            if user:
+                carts = carts.filter(user=user)
+            summary = carts.summary()
+            cache.set(key, summary, CART_SUMMARY_CACHE_TIMEOUT)
+        return summary
+
+    def invalidate_summary(self):
+        invalidate_cart_summaries([self])
 
 
 # -------------------------------
 # 📦 Cart Order Model
 # -------------------------------
+class CartOrderQuerySet(models.QuerySet):
+    def create_from_cart(self, cart_items, **fields):
+        """
+        Create an order and all of its items from cart lines.
+
+        The order is inserted with its final total and the items with a single
+        bulk INSERT, so the query count does not depend on the cart size.
+        cart_items should come with their product loaded (select_related).
+        """
+        items = [
+            CartOrderItem(product=cart.product, qty=cart.qty, price=cart.product.price)
+            for cart in cart_items
+        ]
+        for item in items:
+            item.calculate_totals()
+
+        quantities = Counter()
+        for item in items:
+            quantities[item.product_id] += item.qty
+
+        total = sum(item.total for item in items)
+        with transaction.atomic():
+            order = self.create(total=total, grand_total=total, **fields)
+            StockReservation.objects.reserve(order, quantities)
+            for item in items:
+                item.order = order
+            CartOrderItem.objects.bulk_create(items)
+        return order
+
+    def with_details(self, expand=()):
+        """
+        Load the items CartOrderSerializer renders in a fixed number of
+        queries. Their products are only loaded when the response expands
+        them (?expand=orderitem.product).
+        """
+        items = CartOrderItem.objects.all()
+        if "orderitem.product" in expand:
+            items = items.with_product_card()
+        return self.prefetch_related(models.Prefetch("orderitem", queryset=items))
+
+    def with_weight(self):
+        """
+        Annotate each order with the combined weight of its items in grams,
+        summed by the database in the same query.
+        """
+        return self.annotate(
+            weight=Coalesce(
+                Sum(F("orderitem__product__weight") * F("orderitem__qty")),
+                Value(Decimal("0.00")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
+    def adjust_total(self, order_id, delta):
+        """
+        Shift an order's stored total and grand total by delta with a single
+        UPDATE.
+
+        Orders placed before grand_total was stored still hold 0 there, their
+        totals are recomputed from the items instead.
+        """
+        if order_id is not None and delta:
+            items_total = Coalesce(
+                Subquery(
+                    CartOrderItem.objects.filter(order=OuterRef("pk"))
+                    .values("order")
+                    .annotate(items_total=Sum("total"))
+                    .values("items_total")
+                ),
+                Value(Decimal("0.00")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+            unset = models.Q(grand_total=0)
+            self.filter(pk=order_id).update(
+                total=models.Case(
+                    models.When(unset, then=items_total),
+                    default=F("total") + delta,
+                ),
+                grand_total=models.Case(
+                    models.When(unset, then=items_total + F("delivery_cost")),
+                    default=F("grand_total") + delta,
+                ),
+            )
+
+    def sync_delivery_cost(self, order_ids):
+        """
+        Copy the cost of each order's latest delivery courier onto the order
+        and recompute its grand total, all in one UPDATE.
+        """
+        DeliveryCouriers = self.model._meta.get_field("deliverycouriers").related_model
+        delivery_cost = Coalesce(
+            Subquery(
+                DeliveryCouriers.objects.filter(cart_order=OuterRef("pk"))
+                .order_by("-created_at", "-pk")
+                .values("delivery_cost")[:1]
+            ),
+            Value(Decimal("0.00")),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        return self.filter(pk__in=order_ids).update(
+            delivery_cost=delivery_cost, grand_total=F("total") + delivery_cost
+        )
+
+    def requote_delivery(self, order_id):
+        """
+        Recalculate the latest courier's cost after an order's items change.
+        Orders past payment keep the delivery cost they were charged.
+        """
+        if order_id is None:
+            return
+        DeliveryCouriers = self.model._meta.get_field("deliverycouriers").related_model
+        delivery = (
+            DeliveryCouriers.objects.filter(
+                cart_order=order_id,
+                cart_order__payment_status__in=REQUOTABLE_PAYMENT_STATUSES,
+            )
+            .order_by("-created_at", "-pk")
+            .first()
+        )
+        if delivery:
+            delivery.save()
+
+
 class CartOrder(models.Model):
     PAYMENT_STATUS = (
         ("paid", "Paid"),
@@ -54,6 +469,14 @@ class CartOrder(models.Model):
         User, on_delete=models.SET_NULL, null=True, blank=True, related_name="orders"
     )
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    # Cost of the latest delivery courier, and total plus that cost. Both are
+    # kept current by CartOrderItem and DeliveryCouriers when they change.
+    delivery_cost = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+    grand_total = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
     payment_status = models.CharField(
         max_length=100, choices=PAYMENT_STATUS, default="initiated"
     )
@@ -72,9 +495,15 @@ class CartOrder(models.Model):
     state = models.CharField(max_length=1000, null=True, blank=True)
     country = models.CharField(max_length=1000, null=True, blank=True)
 
+    # PayPal checkout order and the status PayPal last reported for it
+    paypal_order_id = models.CharField(max_length=100, null=True, blank=True)
+    paypal_status = models.CharField(max_length=50, null=True, blank=True)
+
     oid = ShortUUIDField(length=30, max_length=40, alphabet="abcdefghijklmnopqrstuvxyz")
     date = models.DateTimeField(default=timezone.now)
 
+    objects = CartOrderQuerySet.as_manager()
+
     class Meta:
         ordering = ["-date"]
         verbose_name_plural = "Cart Orders"
@@ -85,29 +514,154 @@ class CartOrder(models.Model):
     def get_order_items(self):
         return self.orderitem.all()
 
+    # Kept current with UPDATE deltas by CartOrderItem and DeliveryCouriers,
+    # never written back by a plain save()
+    DELTA_FIELDS = ("total", "delivery_cost", "grand_total")
+
+    # Payment statuses that give an order's held stock back
+    RELEASE_STOCK_STATUSES = ("cancelled", "failed")
+
+    # (payment_status, order_status) as last written to the database, used to
+    # refresh the sales rollup only when one of them changes.
+    _saved_statuses = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = instance.__dict__
+        if "payment_status" in loaded and "order_status" in loaded:
+            instance._saved_statuses = (
+                loaded["payment_status"],
+                loaded["order_status"],
+            )
+        return instance
+
+    def save(self, *args, **kwargs):
+        statuses = (self.payment_status, self.order_status)
+        with transaction.atomic():
+            adding = self._state.adding
+            if not adding and kwargs.get("update_fields") is None:
+                # Totals are only moved by UPDATE deltas, writing back the
+                # loaded values would undo concurrent changes
+                kwargs["update_fields"] = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.DELTA_FIELDS
+                ]
+            super().save(*args, **kwargs)
+            if not adding and statuses != self._saved_statuses:
+                self.sync_reservations()
+                self.refresh_sales_rollup()
+        self._saved_statuses = statuses
+
+    def sync_reservations(self):
+        """
+        Commit the stock holds of an order set to paid outside mark_paid(),
+        e.g. by an admin, and give them back when it is cancelled or failed.
+        """
+        if self.payment_status == "paid":
+            StockReservation.objects.commit(self)
+        elif self.payment_status in self.RELEASE_STOCK_STATUSES:
+            self.reservations.release()
+
+    def refresh_sales_rollup(self):
+        """
+        Recompute the sales rollup and drop the cached sales stats of this
+        order's products once the current transaction commits.
+        """
+        product_ids = list(
+            CartOrderItem.objects.filter(order=self.pk).values_list(
+                "product_id", flat=True
+            )
+        )
+        refresh_product_sales(product_ids)
+
     def calculate_total(self):
         return sum(item.total for item in self.get_order_items())
 
     @property
-    def delivery_cost(self):
-        delivery = self.deliverycouriers_set.last()
-        if delivery:
-            return delivery.calculate_delivery_cost()
-        return Decimal("0.00")
+    def amount_due(self):
+        """
+        Items plus delivery. Orders placed before grand_total was stored still
+        hold 0 there until recompute_order_totals runs, so it is added up.
+        """
+        if not self.grand_total and self.total:
+            return self.total + self.delivery_cost
+        return self.grand_total
 
-    @property
-    def grand_total(self):
-        return self.total + self.delivery_cost
+    def mark_paid(self):
+        """
+        Move a processing order to paid and commit its stock holds.
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.total = self.calculate_total()
-        super().save(update_fields=["total"])
+        The transition is a conditional UPDATE, so concurrent or repeated
+        confirmations make it exactly once. Returns True for that one call.
+        """
+        with transaction.atomic():
+            updated = CartOrder.objects.filter(
+                pk=self.pk, payment_status="processing"
+            ).update(payment_status="paid")
+            if updated:
+                StockReservation.objects.commit(self)
+                self.refresh_sales_rollup()
+        if updated:
+            self.payment_status = "paid"
+            if self._saved_statuses is not None:
+                self._saved_statuses = ("paid", self._saved_statuses[1])
+        return bool(updated)
 
 
 # -------------------------------
 # 🧾 Cart Order Item Model
 # -------------------------------
+class CartOrderItemQuerySet(ProductLineQuerySet):
+    def sales_stats(self, product_ids):
+        """
+        Sales, order, customer and return counts for each of product_ids.
+
+        Every metric is a conditional aggregate over the same join, so all
+        products are covered by one grouped query.
+        """
+        valid = models.Q(order__payment_status="paid") | models.Q(
+            order__order_status="Fulfilled"
+        )
+        returned = models.Q(order__order_status="Cancelled") | models.Q(
+            order__payment_status__in=["refunded", "refunding"]
+        )
+        rows = (
+            self.filter(product__in=product_ids)
+            .order_by()
+            .values("product")
+            .annotate(
+                total_sales=Coalesce(
+                    Sum("total", filter=valid),
+                    Value(Decimal("0.00")),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+                total_orders=models.Count("order", distinct=True, filter=valid),
+                total_customers=models.Count(
+                    "order__user", distinct=True, filter=valid
+                ),
+                total_returns=models.Count("order", distinct=True, filter=returned),
+            )
+        )
+        stats = {row.pop("product"): row for row in rows}
+        return {
+            product_id: {
+                "product_id": product_id,
+                **stats.get(
+                    product_id,
+                    {
+                        "total_sales": Decimal("0.00"),
+                        "total_orders": 0,
+                        "total_customers": 0,
+                        "total_returns": 0,
+                    },
+                ),
+            }
+            for product_id in product_ids
+        }
+
+
 class CartOrderItem(models.Model):
     order = models.ForeignKey(
         CartOrder, on_delete=models.CASCADE, related_name="orderitem"
@@ -123,10 +677,33 @@ class CartOrderItem(models.Model):
     oid = ShortUUIDField(length=30, max_length=40, alphabet="abcdefghijklmnopqrstuvxyz")
     date = models.DateTimeField(default=timezone.now)
 
+    objects = CartOrderItemQuerySet.as_manager()
+
     class Meta:
         ordering = ["-date"]
         verbose_name_plural = "Cart Order Items"
 
+    @classmethod
+    def get_sales_stats(cls, product_ids):
+        """
+        Cached sales stats for several products, keyed by product id.
+
+        Products missing from the cache are computed together in one query.
+        """
+        keys = {product_stats_cache_key(pk): pk for pk in product_ids}
+        cached = cache.get_many(keys)
+        stats = {keys[key]: value for key, value in cached.items()}
+
+        missing = [pk for pk in product_ids if pk not in stats]
+        if missing:
+            computed = cls.objects.sales_stats(missing)
+            cache.set_many(
+                {product_stats_cache_key(pk): value for pk, value in computed.items()},
+                PRODUCT_STATS_CACHE_TIMEOUT,
+            )
+            stats.update(computed)
+        return stats
+
     def __str__(self):
         return self.oid
 
@@ -137,14 +714,227 @@ class CartOrderItem(models.Model):
     def total_price(self):
         return self.total
 
-    def save(self, *args, **kwargs):
+    # (order_id, total) as last written to the database, used to update the
+    # order total by delta instead of recomputing it from every item.
+    _saved_state = (None, Decimal("0.00"))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = instance.__dict__
+        if "order_id" in loaded and "total" in loaded:
+            instance._saved_state = (loaded["order_id"], loaded["total"])
+        else:
+            # Deferred load, look the saved state up again if it is needed
+            instance._saved_state = None
+        return instance
+
+    def get_saved_state(self):
+        if self._saved_state is None:
+            self._saved_state = (
+                type(self)
+                .objects.filter(pk=self.pk)
+                .values_list("order_id", "total")
+                .get()
+            )
+        return self._saved_state
+
+    def calculate_totals(self):
         self.sub_total = self.qty * self.price
         self.total = self.sub_total
-        super().save(*args, **kwargs)
 
-        # Update order total after saving item
-        self.order.total = self.order.calculate_total()
-        self.order.save(update_fields=["total"])
+    def save(self, *args, **kwargs):
+        self.calculate_totals()
+        saved_order_id, saved_total = self.get_saved_state()
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if saved_order_id != self.order_id:
+                CartOrder.objects.adjust_total(saved_order_id, -saved_total)
+                CartOrder.objects.requote_delivery(saved_order_id)
+                saved_total = Decimal("0.00")
+            CartOrder.objects.adjust_total(self.order_id, self.total - saved_total)
+            # The order weight may have changed, which changes delivery cost
+            CartOrder.objects.requote_delivery(self.order_id)
+            refresh_product_sales([self.product_id])
+
+        self._saved_state = (self.order_id, self.total)
+
+    def delete(self, *args, **kwargs):
+        saved_order_id, saved_total = self.get_saved_state()
+
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            CartOrder.objects.adjust_total(saved_order_id, -saved_total)
+            CartOrder.objects.requote_delivery(saved_order_id)
+            refresh_product_sales([self.product_id])
+
+        self._saved_state = (None, Decimal("0.00"))
+        return result
+
+
+class StockReservationQuerySet(models.QuerySet):
+    def _product_model(self):
+        return self.model._meta.get_field("product").related_model
+
+    def reserve(self, order, quantities):
+        """
+        Hold {product_id: qty} of stock for an order until it expires.
+
+        Stock for every product is taken in one conditional UPDATE that only
+        locks the affected product rows. Raises InsufficientStock, leaving
+        stock untouched, if any product is short.
+        """
+        Product = self._product_model()
+        with transaction.atomic():
+            if Product.objects.take_stock(quantities):
+                expires_at = timezone.now() + settings.STOCK_RESERVATION_TTL
+                return self.bulk_create(
+                    [
+                        self.model(
+                            order=order,
+                            product_id=product_id,
+                            qty=qty,
+                            expires_at=expires_at,
+                        )
+                        for product_id, qty in quantities.items()
+                    ]
+                )
+            transaction.set_rollback(True)
+
+        stock = dict(
+            Product.objects.filter(pk__in=quantities).values_list("pk", "stock")
+        )
+        raise InsufficientStock(
+            {
+                "items": {
+                    str(product_id): f"Only {stock.get(product_id, 0)} in stock, "
+                    f"you requested {qty}."
+                    for product_id, qty in quantities.items()
+                    if qty > stock.get(product_id, 0)
+                }
+            }
+        )
+
+    def commit(self, order):
+        """
+        Turn an order's holds into permanent stock decrements once it is paid.
+
+        Holds that already expired gave their stock back, so it is taken again
+        if still available.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            self.filter(order=order, status=StockReservation.Status.HELD).update(
+                status=StockReservation.Status.COMMITTED, updated_at=now
+            )
+            expired = list(
+                self.filter(order=order, status=StockReservation.Status.RELEASED)
+            )
+            if not expired:
+                return
+
+            quantities = Counter()
+            for reservation in expired:
+                quantities[reservation.product_id] += reservation.qty
+            with transaction.atomic():
+                if self._product_model().objects.take_stock(quantities):
+                    self.filter(pk__in=[r.pk for r in expired]).update(
+                        status=StockReservation.Status.COMMITTED, updated_at=now
+                    )
+                    return
+                transaction.set_rollback(True)
+
+        logger.warning(
+            "Order %s was paid after its stock hold expired and stock ran out.",
+            order.oid,
+        )
+
+    def release(self, limit=None):
+        """
+        Give back the stock of held reservations in this queryset.
+
+        Rows locked by a concurrent release or commit are skipped. Returns the
+        number of reservations released.
+        """
+        with transaction.atomic():
+            held = (
+                self.filter(status=StockReservation.Status.HELD)
+                .select_for_update(skip_locked=True)
+                .order_by("expires_at")
+            )
+            if limit:
+                held = held[:limit]
+            held = list(held.values_list("pk", "product_id", "qty"))
+            if not held:
+                return 0
+
+            quantities = Counter()
+            for _, product_id, qty in held:
+                quantities[product_id] += qty
+            self._product_model().objects.restore_stock(quantities)
+            self.model.objects.filter(pk__in=[pk for pk, _, _ in held]).update(
+                status=StockReservation.Status.RELEASED, updated_at=timezone.now()
+            )
+        return len(held)
+
+    def release_expired(self, batch_size=500):
+        """
+        Release expired holds in chunks of batch_size, one transaction each.
+        """
+        released = 0
+        while True:
+            count = self.filter(expires_at__lte=timezone.now()).release(
+                limit=batch_size
+            )
+            released += count
+            if count < batch_size:
+                return released
+
+
+class StockReservation(models.Model):
+    class Status(models.TextChoices):
+        HELD = "held", "Held"
+        COMMITTED = "committed", "Committed"
+        RELEASED = "released", "Released"
+
+    order = models.ForeignKey(
+        CartOrder, on_delete=models.CASCADE, related_name="reservations"
+    )
+    product = models.ForeignKey(
+        "product.Product", on_delete=models.CASCADE, related_name="reservations"
+    )
+    qty = models.PositiveIntegerField()
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.HELD
+    )
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StockReservationQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = "Stock Reservations"
+        indexes = [models.Index(fields=["status", "expires_at"])]
+
+    def __str__(self):
+        return f"{self.qty} x {self.product_id} for {self.order_id} ({self.status})"
+
+
+class WishlistQuerySet(ProductLineQuerySet):
+    def toggle(self, user, product):
+        """
+        Add product to the user's wishlist, or remove it if it is already
+        there. Returns True when the product was added.
+
+        The cached id set is dropped by the Wishlist signals and reloaded on
+        next read.
+        """
+        wishlist, created = self.get_or_create(user=user, product=product)
+        if not created:
+            wishlist.delete()
+        return created
 
 
 class Wishlist(models.Model):
@@ -157,8 +947,29 @@ class Wishlist(models.Model):
     # Date and time field
     date = models.DateTimeField(auto_now_add=True)
 
+    objects = WishlistQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Wishlist"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "product"], name="unique_wishlist_user_product"
+            )
+        ]
+
+    @classmethod
+    def get_product_ids(cls, user):
+        """
+        Cached set of the product ids a user has wishlisted.
+        """
+        key = wishlist_ids_cache_key(user.pk)
+        product_ids = cache.get(key)
+        if product_ids is None:
+            product_ids = set(
+                cls.objects.filter(user=user).values_list("product_id", flat=True)
+            )
+            cache.set(key, product_ids, WISHLIST_IDS_CACHE_TIMEOUT)
+        return product_ids
 
     # Method to return a string representation of the object
     def __str__(self):
@@ -190,3 +1001,166 @@ class Return(models.Model):
     def __str__(self):
         return f"Return for {self.order_item} - {self.status}"
         return f"Return for {self.order_item} - {self.status}"
+
+
+class PayPalWebhookEvent(models.Model):
+    """
+    Append-only inbox of raw PayPal webhook events, processed by a Celery worker.
+    """
+
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    # PayPal transmission headers, needed to verify the event signature later
+    headers = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    outcome = models.CharField(max_length=50, blank=True)
+    # Verification attempts that failed on a PayPal outage, retried with backoff
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "PayPal Webhook Events"
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="paypal_event_pending_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id}"
+
+
+class ProductSalesRollupQuerySet(models.QuerySet):
+    # Order statuses counted as sold and as returned in the rollup
+    SOLD = models.Q(order__order_status="Fulfilled", order__payment_status="paid")
+    RETURNED = models.Q(order__order_status__in=["Cancelled", "Refunded"])
+
+    def refresh(self, product_ids):
+        """
+        Recompute the rollup rows of the given products and upsert them.
+
+        Only the order items of those products are aggregated, so keeping
+        the rollup current after an order changes costs one grouped query.
+        """
+        Product = self.model._meta.get_field("product").related_model
+        product_ids = list(
+            Product.objects.filter(pk__in=set(product_ids)).values_list("pk", flat=True)
+        )
+        if not product_ids:
+            return 0
+
+        totals = {
+            row.pop("product"): row
+            for row in CartOrderItem.objects.filter(product__in=product_ids)
+            .order_by()
+            .values("product")
+            .annotate(
+                total_sales=Coalesce(
+                    Sum("total", filter=self.SOLD),
+                    Value(Decimal("0.00")),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+                total_orders=models.Count("order", distinct=True, filter=self.SOLD),
+                total_customers=models.Count(
+                    "order__user", distinct=True, filter=self.SOLD
+                ),
+                total_returns=models.Count("pk", filter=self.RETURNED),
+            )
+        }
+        now = timezone.now()
+        rows = [
+            self.model(product_id=product_id, updated_at=now, **totals[product_id])
+            if product_id in totals
+            else self.model(product_id=product_id, updated_at=now)
+            for product_id in product_ids
+        ]
+        self.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=[
+                "total_sales",
+                "total_orders",
+                "total_customers",
+                "total_returns",
+                "updated_at",
+            ],
+        )
+        return len(rows)
+
+    def rebuild(self, batch_size=1000):
+        """
+        Recompute the rollup of every product, batch_size products at a time.
+        """
+        Product = self.model._meta.get_field("product").related_model
+        product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+        refreshed = 0
+        for start in range(0, len(product_ids), batch_size):
+            refreshed += self.refresh(product_ids[start : start + batch_size])
+        return refreshed
+
+
+class ProductSalesRollup(models.Model):
+    """
+    Per-product sales totals, kept current as orders change status.
+    """
+
+    product = models.OneToOneField(
+        "product.Product",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="sales_rollup",
+    )
+    total_sales = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+    total_orders = models.PositiveIntegerField(default=0)
+    total_customers = models.PositiveIntegerField(default=0)
+    total_returns = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = ProductSalesRollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = "Product Sales Rollups"
+        indexes = [models.Index(fields=["-total_sales"], name="sales_rollup_sales_idx")]
+
+    def __str__(self):
+        return f"Sales of {self.product_id}"
+
+
+class ArchivedCart(models.Model):
+    """
+    Copy of an abandoned cart line removed by the cart sweeper.
+    """
+
+    product = models.ForeignKey(
+        "product.Product", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    qty = models.PositiveIntegerField()
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+    cart_id = models.UUIDField()
+    date = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Archived Carts"
+
+    def __str__(self):
+        return f"{self.cart_id} archived {self.archived_at:%Y-%m-%d}"
+
+    @classmethod
+    def from_cart(cls, cart):
+        return cls(
+            product_id=cart.product_id,
+            user_id=cart.user_id,
+            qty=cart.qty,
+            total=cart.total,
+            cart_id=cart.cart_id,
+            date=cart.date,
+        )
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class SalesSummaryPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class OrderCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-date", "-id")
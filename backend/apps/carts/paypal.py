@@ -0,0 +1,187 @@
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Refresh access tokens this many seconds before PayPal expires them
+TOKEN_EXPIRY_MARGIN = 60
+
+
+class PayPalError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        # HTTP status PayPal answered with, None when it could not be reached
+        self.status_code = status_code
+
+    @property
+    def is_client_error(self):
+        return self.status_code is not None and 400 <= self.status_code < 500
+
+
+class PayPalClient:
+    """
+    Thin PayPal REST client sharing one pooled session per process.
+
+    Access tokens are kept in memory and in the shared Django cache, so
+    workers only ask PayPal for a new one shortly before it expires.
+    """
+
+    def __init__(
+        self, client_id, secret, base_url, timeout, max_retries, pool_size=10
+    ):
+        self.client_id = client_id
+        self.secret = secret
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token_cache_key = f"paypal:access_token:{client_id}"
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._token = None
+        self._token_expires_at = 0
+        self._lock = threading.Lock()
+
+    def get_access_token(self, force_refresh=False):
+        if not force_refresh and self._token_is_fresh():
+            return self._token
+
+        with self._lock:
+            if not force_refresh:
+                if self._token_is_fresh():
+                    return self._token
+                cached = cache.get(self.token_cache_key)
+                if cached and cached["expires_at"] > time.time():
+                    self._token = cached["access_token"]
+                    self._token_expires_at = cached["expires_at"]
+                    return self._token
+
+            response = self._request(
+                "POST",
+                "/v1/oauth2/token",
+                data={"grant_type": "client_credentials"},
+                auth=(self.client_id, self.secret),
+                headers={"Accept": "application/json"},
+            )
+            if response.status_code != 200:
+                raise PayPalError(
+                    f"Failed to get access token from PayPal. Status code: {response.status_code}"
+                )
+
+            payload = response.json()
+            lifetime = int(payload.get("expires_in", 0)) - TOKEN_EXPIRY_MARGIN
+            self._token = payload["access_token"]
+            self._token_expires_at = time.time() + lifetime
+            if lifetime > 0:
+                cache.set(
+                    self.token_cache_key,
+                    {
+                        "access_token": self._token,
+                        "expires_at": self._token_expires_at,
+                    },
+                    lifetime,
+                )
+            return self._token
+
+    def get_order(self, paypal_order_id):
+        """
+        Fetch a checkout order, raising PayPalError unless PayPal returns it.
+        """
+        response = self._authorized_request(
+            "GET", f"/v2/checkout/orders/{paypal_order_id}"
+        )
+        if response.status_code != 200:
+            raise PayPalError(
+                f"Failed to fetch PayPal order {paypal_order_id}. Status code: {response.status_code}"
+            )
+        return response.json()
+
+    def verify_webhook_signature(self, webhook_id, headers, event):
+        """
+        Ask PayPal whether a webhook event really was sent by PayPal.
+        """
+        response = self._authorized_request(
+            "POST",
+            "/v1/notifications/verify-webhook-signature",
+            json={
+                "auth_algo": headers.get("Paypal-Auth-Algo"),
+                "cert_url": headers.get("Paypal-Cert-Url"),
+                "transmission_id": headers.get("Paypal-Transmission-Id"),
+                "transmission_sig": headers.get("Paypal-Transmission-Sig"),
+                "transmission_time": headers.get("Paypal-Transmission-Time"),
+                "webhook_id": webhook_id,
+                "webhook_event": event,
+            },
+        )
+        if response.status_code != 200:
+            raise PayPalError(
+                f"Failed to verify PayPal webhook. Status code: {response.status_code}",
+                status_code=response.status_code,
+            )
+        return response.json().get("verification_status") == "SUCCESS"
+
+    def _token_is_fresh(self):
+        return self._token is not None and self._token_expires_at > time.time()
+
+    def _authorized_request(self, method, path, **kwargs):
+        # A 401 means the token was revoked early, refresh it once and retry
+        for force_refresh in (False, True):
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.get_access_token(force_refresh)}",
+            }
+            response = self._request(method, path, headers=headers, **kwargs)
+            if response.status_code != 401:
+                break
+        return response
+
+    def _request(self, method, path, **kwargs):
+        try:
+            return self.session.request(
+                method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs
+            )
+        except requests.RequestException as exc:
+            raise PayPalError(f"PayPal request to {path} failed: {exc}") from exc
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_paypal_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PayPalClient(
+                    client_id=settings.PAYPAL_CLIENT_ID,
+                    secret=settings.PAYPAL_SECRET_ID,
+                    base_url=settings.PAYPAL_API_BASE,
+                    timeout=settings.PAYPAL_TIMEOUT,
+                    max_retries=settings.PAYPAL_MAX_RETRIES,
+                )
+    return _client
+
+
+@receiver(setting_changed)
+def reset_paypal_client(setting, **kwargs):
+    global _client
+    if setting.startswith("PAYPAL_"):
+        _client = None
@@ -1,7 +1,7 @@
-from decimal import Decimal
-
 from apps.product.models import DeliveryCouriers, Product
-from apps.product.serializers import ProductSerializer
+from apps.common.serializers import ExpandableFieldsMixin
+from apps.product.serializers import ProductCardSerializer
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
@@ -12,7 +12,7 @@ User = get_user_model()
 
 
 class CartSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    product = ProductCardSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.filter(is_available=True),
         source="product",
@@ -25,17 +25,15 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ["id", "product", "product_id", "qty", "total", "cart_id", "date"]
         read_only_fields = ["total", "cart_id", "date", "product"]
 
-    def validate_qty(self, value):
-        prod = None
-        if self.initial_data.get("product_id"):
-            prod = Product.objects.filter(id=self.initial_data["product_id"]).first()
-        elif self.instance:
-            prod = self.instance.product
-        if prod and value > prod.stock:
+    def validate(self, attrs):
+        # Reuse the product already resolved by product_id instead of refetching it
+        prod = attrs.get("product") or (self.instance and self.instance.product)
+        value = attrs.get("qty")
+        if prod and value and value > prod.stock:
             raise serializers.ValidationError(
-                f"Only {prod.stock} in stock, you requested {value}."
+                {"qty": f"Only {prod.stock} in stock, you requested {value}."}
             )
-        return value
+        return attrs
 
     def create(self, validated_data):
         # Automatically assign the authenticated user
@@ -43,9 +41,41 @@ class CartSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class CartBatchItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    qty = serializers.IntegerField(min_value=1)
+
+
+class GuestCartItemSerializer(CartBatchItemSerializer):
+    # Products are resolved when the guest cart is merged, not on every add
+    cart_id = serializers.UUIDField(required=False)
+    qty = serializers.IntegerField(
+        min_value=1, max_value=settings.GUEST_CART_MAX_QTY, default=1
+    )
+
+
+class CartBatchSerializer(serializers.Serializer):
+    items = CartBatchItemSerializer(many=True, allow_empty=False, max_length=50)
+
+    def validate_items(self, value):
+        # Merge repeated products and resolve them all with a single query
+        quantities = {}
+        for item in value:
+            product_id = item["product_id"]
+            quantities[product_id] = quantities.get(product_id, 0) + item["qty"]
+
+        products = Product.objects.filter(is_available=True).in_bulk(list(quantities))
+        missing = [str(pk) for pk in quantities if pk not in products]
+        if missing:
+            raise serializers.ValidationError(
+                f"Invalid or unavailable product ids: {', '.join(missing)}."
+            )
+        return [(products[pk], qty) for pk, qty in quantities.items()]
+
+
 # Define a serializer for the CartOrderItem model
-class CartOrderItemSerializer(serializers.ModelSerializer):
-    # product = ProductSerializer()
+class CartOrderItemSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {"product": ProductCardSerializer}
 
     class Meta:
         model = CartOrderItem
@@ -61,23 +91,18 @@ class CartOrderItemSerializer(serializers.ModelSerializer):
             "date",
         ]
 
-    def __init__(self, *args, **kwargs):
-        super(CartOrderItemSerializer, self).__init__(*args, **kwargs)
-        # Customize serialization depth based on the request method.
-        request = self.context.get("request")
-        if request and request.method == "POST":
-            # When creating a new cart order item, set serialization depth to 0.
-            self.Meta.depth = 0
-        else:
-            # For other methods, set serialization depth to 3.
-            self.Meta.depth = 3
-
 
 # Define a serializer for the CartOrder model
-class CartOrderSerializer(serializers.ModelSerializer):
+class CartOrderSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     orderitem = CartOrderItemSerializer(many=True, read_only=True)
-    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
-    total = serializers.SerializerMethodField()
+    # "total" has always included delivery, so it is the grand total
+    total = serializers.DecimalField(
+        source="amount_due",
+        max_digits=12,
+        decimal_places=2,
+        coerce_to_string=False,
+        read_only=True,
+    )
 
     class Meta:
         model = CartOrder
@@ -85,6 +110,7 @@ class CartOrderSerializer(serializers.ModelSerializer):
             "id",
             "user",
             "total",
+            "delivery_cost",
             "payment_status",
             "order_status",
             "full_name",
@@ -98,45 +124,43 @@ class CartOrderSerializer(serializers.ModelSerializer):
             "date",
             "orderitem",
         ]
+        read_only_fields = ["delivery_cost"]
 
-    def get_total(self, obj):
-        """
-        Calculates order total plus delivery cost.
-        """
-        base = obj.calculate_total()
-        delivery = obj.deliverycouriers_set.last()
-        if delivery:
-            cost = delivery.calculate_delivery_cost()
-        else:
-            cost = Decimal("0.00")
-        return base + cost
-
-    # def get_grand_total(self, obj):
-    #     base = Decimal(obj.total or 0)
-    #     try:
-    #         delivery = obj.deliverycouriers_set.latest("created_at").delivery_cost
-    #     except (DeliveryCouriers.DoesNotExist, AttributeError):
-    #         delivery = Decimal("0")
-    #     return base + delivery
+
+class PaymentStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CartOrder
+        # Served without authentication, so the PayPal order id stays private
+        fields = ["oid", "payment_status", "paypal_status"]
+        read_only_fields = fields
 
 
 class WishlistCreateSerializer(serializers.ModelSerializer):
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.filter(is_available=True), write_only=True
     )
-    product = ProductSerializer(read_only=True)
+    product = ProductCardSerializer(read_only=True)
 
     class Meta:
         model = Wishlist
         fields = ["id", "product_id", "product"]
 
 
-class ProductSalesSummarySerializer(serializers.Serializer):
-    product_id = serializers.IntegerField()
-    product_name = serializers.CharField()
-    total_sales = serializers.FloatField()
-    total_orders = serializers.IntegerField()
-    total_customers = serializers.IntegerField()
-    total_returns = serializers.IntegerField()
-    total_customers = serializers.IntegerField()
-    total_returns = serializers.IntegerField()
+class ProductSalesSummarySerializer(serializers.ModelSerializer):
+    # Totals are annotated from the rollup by ProductSalesSummaryListAPIView
+    product_id = serializers.IntegerField(source="pk", read_only=True)
+    total_sales = serializers.FloatField(read_only=True)
+    total_orders = serializers.IntegerField(read_only=True)
+    total_customers = serializers.IntegerField(read_only=True)
+    total_returns = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            "product_id",
+            "product_name",
+            "total_sales",
+            "total_orders",
+            "total_customers",
+            "total_returns",
+        ]
@@ -0,0 +1,22 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.carts.models import CartOrder, Wishlist, wishlist_ids_cache_key
+
+
+@receiver(pre_delete, sender=CartOrder)
+def release_deleted_order(sender, instance, **kwargs):
+    # Also runs for queryset and admin bulk deletes, which skip
+    # CartOrder.delete(). Stock still held for the order is given back before
+    # its holds cascade away.
+    instance.reservations.release()
+    instance.refresh_sales_rollup()
+
+
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+def invalidate_wishlist_ids(sender, instance, **kwargs):
+    key = wishlist_ids_cache_key(instance.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
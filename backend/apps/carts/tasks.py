@@ -0,0 +1,68 @@
+import logging
+import time
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def release_expired_reservations(batch_size=500):
+    from apps.carts.models import StockReservation
+
+    released = StockReservation.objects.release_expired(batch_size=batch_size)
+    logger.info(f"Released {released} expired stock reservations.")
+    return released
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30)
+def verify_paypal_payment(self, order_id, paypal_order_id):
+    from apps.carts.models import CartOrder
+    from apps.carts.paypal import PayPalError
+    from apps.carts.utils import verify_paypal_payment
+
+    order = CartOrder.objects.get(pk=order_id)
+    if order.payment_status != "processing":
+        return order.payment_status
+
+    try:
+        paypal_status, _ = verify_paypal_payment(order, paypal_order_id)
+    except PayPalError as exc:
+        raise self.retry(exc=exc)
+    return paypal_status
+
+
+@shared_task
+def process_paypal_webhook_events(batch_size=100):
+    from apps.carts.utils import process_paypal_webhook_events
+
+    processed = process_paypal_webhook_events(batch_size=batch_size)
+    logger.info(f"Processed {processed} PayPal webhook events.")
+    return processed
+
+
+@shared_task
+def rebuild_sales_rollup(batch_size=1000):
+    from apps.carts.models import ProductSalesRollup
+
+    refreshed = ProductSalesRollup.objects.rebuild(batch_size=batch_size)
+    logger.info(f"Rebuilt the sales rollup for {refreshed} products.")
+    return refreshed
+
+
+@shared_task
+def sweep_abandoned_carts(chunk_size=1000):
+    from django.conf import settings
+    from django.utils import timezone
+
+    from apps.carts.models import Cart
+
+    started = time.monotonic()
+    removed = Cart.objects.sweep_abandoned(
+        timezone.now() - settings.ABANDONED_CART_MAX_AGE,
+        chunk_size=chunk_size,
+        archive=settings.ABANDONED_CART_ARCHIVE,
+    )
+    elapsed = time.monotonic() - started
+    logger.info(f"Swept {removed} abandoned cart lines in {elapsed:.2f}s.")
+    return {"removed": removed, "seconds": round(elapsed, 2)}
@@ -1,3 +1,1022 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.carts.guest import GuestCart
+from apps.carts.models import (
+    ArchivedCart,
+    Cart,
+    CartOrder,
+    CartOrderItem,
+    PayPalWebhookEvent,
+    ProductSalesRollup,
+    StockReservation,
+    Wishlist,
+)
+from apps.carts.exceptions import GuestCartLimitExceeded, InsufficientStock
+from apps.carts.tasks import verify_paypal_payment
+from apps.carts.utils import MAX_WEBHOOK_ATTEMPTS, process_paypal_webhook_events
+from apps.common.testing import make_product, make_superuser, make_user
+from apps.common.utils import send_queued_emails
+from apps.product.models import DeliveryCouriers, MultiProductImages, Product
+
+
+class CreateOrderViewTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, size):
+        for i in range(size):
+            product = make_product(f"Product {i}", price=10 + i)
+            Cart.objects.create(product=product, user=self.user, qty=2)
+        return list(Cart.objects.filter(user=self.user).select_related("product"))
+
+    def test_create_order_from_cart(self):
+        cart = self.fill_cart(1)[0]
+
+        response = self.client.post(
+            reverse("create-order"),
+            {
+                "cart_id": str(cart.cart_id),
+                "full_name": "Test User",
+                "email": "buyer@example.com",
+                "mobile": "0700000000",
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        order = CartOrder.objects.get(oid=response.data["order_oid"])
+        self.assertEqual(order.payment_status, "processing")
+        self.assertEqual(order.total, 20)
+
+    def test_order_total_matches_items(self):
+        order = CartOrder.objects.create_from_cart(self.fill_cart(3), user=self.user)
+
+        order.refresh_from_db()
+        self.assertEqual(order.orderitem.count(), 3)
+        self.assertEqual(order.total, sum(2 * (10 + i) for i in range(3)))
+
+    def test_query_count_is_constant_in_cart_size(self):
+        counts = []
+        for size in (3, 30):
+            Cart.objects.all().delete()
+            cart_items = self.fill_cart(size)
+            with CaptureQueriesContext(connection) as queries:
+                CartOrder.objects.create_from_cart(cart_items, user=self.user)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+
+class PayPalStubHandler(BaseHTTPRequestHandler):
+    """
+    Offline stand-in for the PayPal token and checkout order endpoints.
+    """
+
+    def do_POST(self):
+        if self.path == "/v1/notifications/verify-webhook-signature":
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            signature = json.loads(body)["transmission_sig"]
+            if signature in self.server.verify_errors:
+                return self.send_json(self.server.verify_errors[signature], {})
+            verified = "SUCCESS" if signature == "valid" else "FAILURE"
+            return self.send_json(200, {"verification_status": verified})
+        if self.path != "/v1/oauth2/token":
+            return self.send_json(404, {})
+        self.server.token_requests += 1
+        self.send_json(200, {"access_token": "stub-token", "expires_in": 3600})
+
+    def do_GET(self):
+        if self.headers.get("Authorization") != "Bearer stub-token":
+            return self.send_json(401, {})
+        paypal_order_id = self.path.rsplit("/", 1)[-1]
+        status = "APPROVED" if paypal_order_id == "approved" else "COMPLETED"
+        self.send_json(200, {"id": paypal_order_id, "status": status})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PayPalStubTestCase(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.paypal = ThreadingHTTPServer(("127.0.0.1", 0), PayPalStubHandler)
+        cls.paypal.verify_errors = {"junk": 400, "outage": 503}
+        threading.Thread(target=cls.paypal.serve_forever, daemon=True).start()
+        cls.paypal_settings = override_settings(
+            PAYPAL_API_BASE=f"http://127.0.0.1:{cls.paypal.server_port}",
+            PAYPAL_CLIENT_ID="client-id",
+            PAYPAL_SECRET_ID="secret",
+            PAYPAL_WEBHOOK_ID="webhook-id",
+        )
+        cls.paypal_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.paypal_settings.disable()
+        cls.paypal.shutdown()
+        cls.paypal.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.paypal.token_requests = 0
+
+    def create_order(self):
+        return CartOrder.objects.create(
+            full_name="Test User",
+            email="buyer@example.com",
+            mobile="0700000000",
+            payment_status="processing",
+        )
+
+
+class PaymentSuccessViewTests(PayPalStubTestCase):
+
+    def confirm(self, order, paypal_order_id):
+        return self.client.post(
+            reverse("payment-success"),
+            {"order_oid": order.oid, "payapl_order_id": paypal_order_id},
+            format="json",
+        )
+
+    def test_completed_payment_marks_order_paid(self):
+        order = self.create_order()
+
+        response = self.confirm(order, "completed")
+
+        self.assertEqual(response.status_code, 201)
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, "paid")
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(send_queued_emails(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_access_token_is_reused_across_payments(self):
+        for _ in range(3):
+            response = self.confirm(self.create_order(), "completed")
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.paypal.token_requests, 1)
+
+    def test_incomplete_payment_is_rejected(self):
+        order = self.create_order()
+
+        response = self.confirm(order, "approved")
+
+        self.assertEqual(response.status_code, 400)
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, "processing")
+
+    @override_settings(PAYPAL_VERIFY_ASYNC=True)
+    def test_async_mode_queues_verification(self):
+        order = self.create_order()
+
+        with mock.patch.object(verify_paypal_payment, "delay") as delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.confirm(order, "completed")
+            # Nothing is queued before the PayPal order id is committed
+            delay.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual(response.status_code, 202)
+        delay.assert_called_once_with(order.pk, "completed")
+        status_response = self.client.get(response.data["status_url"])
+        self.assertEqual(status_response.data["payment_status"], "processing")
+        self.assertIsNone(status_response.data["paypal_status"])
+
+        # Running the task twice marks the order paid and emails only once
+        verify_paypal_payment.apply(args=(order.pk, "completed"))
+        verify_paypal_payment.apply(args=(order.pk, "completed"))
+
+        status_response = self.client.get(response.data["status_url"])
+        self.assertEqual(status_response.data["payment_status"], "paid")
+        self.assertEqual(status_response.data["paypal_status"], "COMPLETED")
+        self.assertNotIn("paypal_order_id", status_response.data)
+        self.assertEqual(send_queued_emails(), 1)
+
+        # A replayed callback cannot swap the PayPal order of a paid order
+        with mock.patch.object(verify_paypal_payment, "delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.confirm(order, "forged")
+        self.assertEqual(response.status_code, 409)
+        delay.assert_not_called()
+        order.refresh_from_db()
+        self.assertEqual(order.paypal_order_id, "completed")
+
+
+class PayPalWebhookTests(PayPalStubTestCase):
+    def send_event(self, order, event_id, signature="valid"):
+        return self.client.post(
+            reverse("paypal-webhook"),
+            {
+                "id": event_id,
+                "event_type": "CHECKOUT.ORDER.COMPLETED",
+                "resource": {
+                    "id": "PAYPAL-ORDER",
+                    "purchase_units": [{"custom_id": order.oid}],
+                },
+            },
+            format="json",
+            headers={"Paypal-Transmission-Sig": signature},
+        )
+
+    def test_retried_events_are_stored_once(self):
+        order = self.create_order()
+
+        for _ in range(2):
+            self.assertEqual(self.send_event(order, "WH-1").status_code, 200)
+
+        self.assertEqual(PayPalWebhookEvent.objects.count(), 1)
+
+    def test_verified_event_marks_order_paid(self):
+        order = self.create_order()
+        self.send_event(order, "WH-1")
+
+        self.assertEqual(process_paypal_webhook_events(), 1)
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, "paid")
+        event = PayPalWebhookEvent.objects.get()
+        self.assertEqual(event.outcome, "paid")
+        self.assertEqual(process_paypal_webhook_events(), 0)
+
+    def test_forged_event_is_rejected(self):
+        order = self.create_order()
+        self.send_event(order, "WH-1", signature="forged")
+
+        process_paypal_webhook_events()
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, "processing")
+        self.assertEqual(PayPalWebhookEvent.objects.get().outcome, "rejected")
+
+    def test_events_without_order_ids_match_no_order(self):
+        order = self.create_order()
+        CartOrder.objects.filter(pk=order.pk).update(
+            payment_status="paid", paypal_order_id=None
+        )
+        # Brings the order without a PayPal order id into the batch
+        self.client.post(
+            reverse("paypal-webhook"),
+            {
+                "id": "WH-PENDING",
+                "event_type": "PAYMENT.CAPTURE.PENDING",
+                "resource": {"custom_id": order.oid},
+            },
+            format="json",
+            headers={"Paypal-Transmission-Sig": "valid"},
+        )
+        self.client.post(
+            reverse("paypal-webhook"),
+            {
+                "id": "WH-STRAY",
+                "event_type": "PAYMENT.CAPTURE.REFUNDED",
+                "resource": {"id": "CAPTURE"},
+            },
+            format="json",
+            headers={"Paypal-Transmission-Sig": "valid"},
+        )
+
+        self.assertEqual(process_paypal_webhook_events(), 2)
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, "paid")
+        self.assertEqual(
+            PayPalWebhookEvent.objects.get(event_id="WH-STRAY").outcome,
+            "unknown_order",
+        )
+
+    def test_unverifiable_events_do_not_block_the_inbox(self):
+        order = self.create_order()
+        self.send_event(order, "WH-JUNK", signature="junk")
+        self.send_event(order, "WH-OUTAGE", signature="outage")
+        self.client.post(
+            reverse("paypal-webhook"),
+            {"id": "WH-NO-HEADERS", "event_type": "CHECKOUT.ORDER.COMPLETED"},
+            format="json",
+        )
+        self.send_event(order, "WH-VALID")
+
+        with override_settings(PAYPAL_MAX_RETRIES=0):
+            self.assertEqual(process_paypal_webhook_events(batch_size=10), 3)
+
+        outcomes = dict(PayPalWebhookEvent.objects.values_list("event_id", "outcome"))
+        self.assertEqual(outcomes["WH-JUNK"], "rejected")
+        self.assertEqual(outcomes["WH-NO-HEADERS"], "rejected")
+        self.assertEqual(outcomes["WH-VALID"], "paid")
+        outage = PayPalWebhookEvent.objects.get(event_id="WH-OUTAGE")
+        self.assertIsNone(outage.processed_at)
+        self.assertEqual(outage.attempts, 1)
+        self.assertGreater(outage.next_attempt_at, timezone.now())
+        # Backing off, so the next run does not pick it up
+        self.assertEqual(process_paypal_webhook_events(), 0)
+
+        PayPalWebhookEvent.objects.filter(pk=outage.pk).update(
+            attempts=MAX_WEBHOOK_ATTEMPTS - 1, next_attempt_at=timezone.now()
+        )
+        with override_settings(PAYPAL_MAX_RETRIES=0):
+            self.assertEqual(process_paypal_webhook_events(), 1)
+        outage.refresh_from_db()
+        self.assertEqual(outage.outcome, "verification_failed")
+
+
+class OrderTotalDeltaTests(APITestCase):
+    def setUp(self):
+        self.product = make_product(stock=100)
+        self.orders = [
+            CartOrder.objects.create(full_name=f"Buyer {i}", email="b@example.com")
+            for i in range(2)
+        ]
+
+    def add_item(self, order, qty):
+        return CartOrderItem.objects.create(
+            order=order, product=self.product, qty=qty, price=10
+        )
+
+    def totals(self):
+        return [CartOrder.objects.get(pk=order.pk).total for order in self.orders]
+
+    def test_items_move_the_total_by_deltas(self):
+        first, second = self.orders
+        item = self.add_item(first, 2)
+        self.add_item(first, 1)
+        self.assertEqual(self.totals(), [30, 0])
+
+        item.qty = 4
+        item.save()
+        self.assertEqual(self.totals(), [50, 0])
+
+        item.order = second
+        item.save()
+        self.assertEqual(self.totals(), [10, 40])
+
+        item.delete()
+        self.assertEqual(self.totals(), [10, 0])
+
+    def test_saving_a_loaded_order_keeps_concurrent_deltas(self):
+        order = CartOrder.objects.get(pk=self.orders[0].pk)
+        self.add_item(self.orders[0], 3)
+
+        order.order_status = "Fulfilled"
+        order.save()
+
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.grand_total), (30, 30))
+        self.assertEqual(order.order_status, "Fulfilled")
+
+    def test_deferred_items_load_without_extra_queries(self):
+        for order in self.orders:
+            self.add_item(order, 1)
+
+        with self.assertNumQueries(1):
+            items = list(CartOrderItem.objects.only("id", "qty"))
+
+        # The saved state is looked up when the item is saved instead
+        item = items[0]
+        item.qty = 5
+        item.save()
+        self.assertEqual(sorted(self.totals()), [10, 50])
+
+    def test_recompute_order_totals_repairs_drift(self):
+        self.add_item(self.orders[0], 2)
+        CartOrder.objects.filter(pk=self.orders[0].pk).update(total=99, grand_total=99)
+
+        out = StringIO()
+        call_command("recompute_order_totals", "--dry-run", stdout=out)
+        self.assertIn("1 orders have a drifted total", out.getvalue())
+        self.assertEqual(self.totals(), [99, 0])
+
+        call_command("recompute_order_totals", batch_size=1, stdout=StringIO())
+        order = CartOrder.objects.get(pk=self.orders[0].pk)
+        self.assertEqual((order.total, order.grand_total), (20, 20))
+
+
+class ProductCardQueryTests(APITestCase):
+    """
+    Cart and wishlist lines render their product cards in a fixed number of
+    queries, however many lines there are.
+    """
+
+    CART_QUERIES = 3  # lines, multi_images, tags
+    WISHLIST_QUERIES = 4  # user, lines, multi_images, tags
+
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+
+    def add_lines(self, count):
+        for i in range(count):
+            product = make_product(f"Product {i}")
+            product.tags.add("summer", f"tag-{i}")
+            MultiProductImages.objects.create(product=product)
+            Cart.objects.create(user=self.user, product=product, qty=1)
+            Wishlist.objects.create(user=self.user, product=product)
+
+    def test_query_count_does_not_grow_with_the_lines(self):
+        for count in (2, 10):
+            self.add_lines(count)
+            with self.assertNumQueries(self.CART_QUERIES):
+                response = self.client.get(reverse("cart-create-update"))
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(self.WISHLIST_QUERIES):
+                response = self.client.get(
+                    reverse("customer-wishlist", args=[self.user.id])
+                )
+            self.assertEqual(response.status_code, 200)
+
+
+class CartSummaryCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.product = make_product()
+        self.cart, _ = Cart.objects.add_item(self.user, self.product, 1)
+        self.url = reverse("cart-total", args=[self.cart.cart_id])
+
+    def summary(self):
+        return self.client.get(self.url).data
+
+    def test_summary_is_served_from_cache(self):
+        self.assertEqual(self.summary(), {"total_amount": 10.0, "total_items": 1})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.summary(), {"total_amount": 10.0, "total_items": 1})
+
+    def test_summary_follows_cart_changes(self):
+        self.summary()
+
+        # The F() increment bypasses save()
+        Cart.objects.add_item(self.user, self.product, 2)
+        self.assertEqual(self.summary(), {"total_amount": 30.0, "total_items": 3})
+
+        Cart.objects.add_items(self.user, [(self.product, 1)])
+        self.assertEqual(self.summary(), {"total_amount": 40.0, "total_items": 4})
+
+        cart = Cart.objects.get(pk=self.cart.pk)
+        cart.qty = 2
+        cart.save()
+        self.assertEqual(self.summary(), {"total_amount": 20.0, "total_items": 2})
+
+        self.client.delete(
+            reverse("cart-item-delete", args=[self.cart.cart_id, self.cart.pk])
+        )
+        self.assertEqual(self.summary(), {"total_amount": 0.0, "total_items": 0})
+
+
+class CartUpsertTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.products = [make_product(f"Product {i}", stock=5) for i in range(2)]
+
+    def lines(self):
+        return dict(
+            Cart.objects.filter(user=self.user).values_list("product_id", "qty")
+        )
+
+    def test_adding_an_existing_line_increments_it(self):
+        product = self.products[0]
+        _, created = Cart.objects.add_item(self.user, product, 2)
+        self.assertTrue(created)
+
+        cart, created = Cart.objects.add_item(self.user, product, 3)
+
+        self.assertFalse(created)
+        self.assertEqual((cart.qty, cart.total), (5, 50))
+        self.assertEqual(self.lines(), {product.pk: 5})
+
+    def test_adding_past_stock_is_rejected(self):
+        product = self.products[0]
+        Cart.objects.add_item(self.user, product, 4)
+
+        with self.assertRaises(InsufficientStock):
+            Cart.objects.add_item(self.user, product, 2)
+        with self.assertRaises(InsufficientStock):
+            Cart.objects.add_item(self.user, self.products[1], 6)
+
+        self.assertEqual(self.lines(), {product.pk: 4})
+
+    def test_batch_with_one_bad_line_writes_nothing(self):
+        first, second = self.products
+        Cart.objects.add_item(self.user, first, 1)
+
+        with self.assertRaises(InsufficientStock) as raised:
+            Cart.objects.add_items(self.user, [(first, 2), (second, 6)])
+
+        self.assertEqual(list(raised.exception.detail["items"]), [str(second.pk)])
+        self.assertEqual(self.lines(), {first.pk: 1})
+
+        Cart.objects.add_items(self.user, [(first, 2), (second, 3)])
+        self.assertEqual(self.lines(), {first.pk: 3, second.pk: 3})
+
+    def test_one_line_per_user_and_product(self):
+        product = self.products[0]
+        Cart.objects.create(user=self.user, product=product, qty=1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=self.user, product=product, qty=1)
+        self.assertEqual(self.lines(), {product.pk: 1})
+
+
+class StockReservationTests(APITestCase):
+    def setUp(self):
+        self.products = [make_product(f"Product {i}", stock=5) for i in range(2)]
+        self.order = CartOrder.objects.create(
+            full_name="Test User",
+            email="buyer@example.com",
+            mobile="0700000000",
+            payment_status="processing",
+        )
+
+    def reserve(self, first=2, second=1):
+        return StockReservation.objects.reserve(
+            self.order, {self.products[0].pk: first, self.products[1].pk: second}
+        )
+
+    def stock(self):
+        return [Product.objects.get(pk=product.pk).stock for product in self.products]
+
+    def test_reserving_more_than_in_stock_takes_nothing(self):
+        with self.assertRaises(InsufficientStock):
+            self.reserve(first=2, second=6)
+
+        self.assertEqual(self.stock(), [5, 5])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_committed_holds_keep_their_stock(self):
+        self.reserve()
+        self.assertEqual(self.stock(), [3, 4])
+
+        StockReservation.objects.commit(self.order)
+
+        self.assertEqual(self.order.reservations.release(), 0)
+        self.assertEqual(self.stock(), [3, 4])
+        self.assertFalse(
+            self.order.reservations.exclude(
+                status=StockReservation.Status.COMMITTED
+            ).exists()
+        )
+
+    def test_released_holds_return_their_stock(self):
+        self.reserve()
+
+        self.assertEqual(self.order.reservations.release(), 2)
+
+        self.assertEqual(self.stock(), [5, 5])
+
+    def test_expired_holds_return_stock_exactly_once(self):
+        self.reserve()
+        StockReservation.objects.update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertEqual(StockReservation.objects.release_expired(batch_size=1), 2)
+        self.assertEqual(StockReservation.objects.release_expired(), 0)
+
+        self.assertEqual(self.stock(), [5, 5])
+
+    def test_admin_status_changes_commit_or_release_holds(self):
+        admin = make_superuser()
+        self.client.force_authenticate(admin)
+        self.reserve()
+
+        response = self.client.patch(
+            reverse("order-update", args=[self.order.pk]),
+            {"payment_status": "paid"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        StockReservation.objects.update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertEqual(StockReservation.objects.release_expired(), 0)
+        self.assertEqual(self.stock(), [3, 4])
+
+        order = CartOrder.objects.create(full_name="Other", payment_status="processing")
+        StockReservation.objects.reserve(order, {self.products[0].pk: 3})
+        self.client.patch(
+            reverse("order-update", args=[order.pk]),
+            {"payment_status": "cancelled"},
+            format="json",
+        )
+        self.assertEqual(self.stock(), [3, 4])
+
+    def test_deleting_orders_releases_their_holds(self):
+        self.reserve()
+        self.order.delete()
+        self.assertEqual(self.stock(), [5, 5])
+
+        # Queryset and admin bulk deletes skip CartOrder.delete()
+        order = CartOrder.objects.create(full_name="Other", payment_status="processing")
+        StockReservation.objects.reserve(order, {self.products[0].pk: 4})
+        CartOrder.objects.filter(pk=order.pk).delete()
+        self.assertEqual(self.stock(), [5, 5])
+
+
+class AbandonedCartSweepTests(APITestCase):
+    def test_old_carts_are_archived_in_chunks(self):
+        old = timezone.now() - timedelta(days=60)
+        for i in range(5):
+            user = make_user(f"buyer{i}")
+            product = make_product(f"Product {i}")
+            cart = Cart.objects.create(product=product, user=user, qty=1)
+            Cart.objects.filter(pk=cart.pk).update(date=old, updated_at=old)
+        # Old lines changed recently are still in use
+        first, last = Cart.objects.order_by("pk")[::4]
+        Cart.objects.add_item(first.user, first.product, 1)
+        Cart.objects.add_items(last.user, [(last.product, 1)])
+
+        removed = Cart.objects.sweep_abandoned(
+            timezone.now() - timedelta(days=30), chunk_size=2
+        )
+
+        self.assertEqual(removed, 3)
+        self.assertEqual(Cart.objects.count(), 2)
+        self.assertEqual(ArchivedCart.objects.filter(date=old).count(), 3)
+
+
+class GuestCartTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.products = [
+            make_product(f"Product {i}", price=10 + i, stock=5) for i in range(3)
+        ]
+
+    def test_anonymous_add_to_cart_does_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                reverse("guest-cart-create"),
+                {"product_id": self.products[0].pk, "qty": 2},
+            )
+            cart_id = response.data["cart_id"]
+            self.client.post(
+                reverse("guest-cart", args=[cart_id]),
+                {"product_id": self.products[0].pk},
+            )
+            response = self.client.get(reverse("guest-cart", args=[cart_id]))
+
+        self.assertEqual(
+            response.data["items"], [{"product_id": self.products[0].pk, "qty": 3}]
+        )
+
+    @override_settings(GUEST_CART_MAX_LINES=2, GUEST_CART_MAX_QTY=3)
+    def test_guest_cart_lines_and_quantities_are_capped(self):
+        first, second, third = (product.pk for product in self.products)
+        guest_cart = GuestCart()
+        guest_cart.add(first, 2)
+        # Another request working on the same cart
+        GuestCart(guest_cart.cart_id).add(first, 1)
+        guest_cart.add(second, 1)
+
+        with self.assertRaises(GuestCartLimitExceeded):
+            guest_cart.add(first, 1)
+        with self.assertRaises(GuestCartLimitExceeded):
+            guest_cart.add(third, 1)
+        self.assertEqual(guest_cart.get_items(), {first: 3, second: 1})
+
+        # A removed product keeps its place and can be added again
+        guest_cart.remove(second)
+        self.assertEqual(guest_cart.get_items(), {first: 3})
+        self.assertEqual(guest_cart.add(second, 2), {first: 3, second: 2})
+
+        response = self.client.post(
+            reverse("guest-cart", args=[guest_cart.cart_id]),
+            {"product_id": third, "qty": 1},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_guest_cart_is_merged_on_login(self):
+        first, second, third = self.products
+        Cart.objects.create(product=first, user=self.user, qty=2)
+        guest_cart = GuestCart()
+        guest_cart.add(first.pk, 4)
+        guest_cart.add(second.pk, 1)
+        guest_cart.add(third.pk + 100, 1)
+
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {
+                "email": "buyer@example.com",
+                "password": "testpass123",
+                "guest_cart_id": guest_cart.cart_id,
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.data)
+        lines = dict(
+            Cart.objects.filter(user=self.user).values_list("product_id", "qty")
+        )
+        # Quantities are added up but capped at the available stock
+        self.assertEqual(lines, {first.pk: 5, second.pk: 1})
+        self.assertEqual(Cart.objects.get(product=first).total, first.price * 5)
+        self.assertEqual(guest_cart.get_items(), {})
+
+
+class ProductSalesRollupTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.products = [make_product(f"Product {i}", price=10 + i) for i in range(3)]
+
+    def place_order(self, product, qty):
+        Cart.objects.filter(user=self.user).delete()
+        Cart.objects.create(product=product, user=self.user, qty=qty)
+        return CartOrder.objects.create_from_cart(
+            list(Cart.objects.filter(user=self.user).select_related("product")),
+            user=self.user,
+            payment_status="processing",
+        )
+
+    def test_rollup_follows_order_status(self):
+        product = self.products[0]
+        order = self.place_order(product, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.mark_paid()
+        # Paid but not yet fulfilled does not count as a sale
+        self.assertEqual(ProductSalesRollup.objects.get(product=product).total_sales, 0)
+
+        order.order_status = "Fulfilled"
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+        rollup = ProductSalesRollup.objects.get(product=product)
+        self.assertEqual(rollup.total_sales, 20)
+        self.assertEqual(rollup.total_orders, 1)
+        self.assertEqual(rollup.total_customers, 1)
+
+        order.order_status = "Cancelled"
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.total_sales, 0)
+        self.assertEqual(rollup.total_returns, 1)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        for product, qty in zip(self.products, (1, 3, 2)):
+            order = self.place_order(product, qty)
+            CartOrder.objects.filter(pk=order.pk).update(
+                payment_status="paid", order_status="Fulfilled"
+            )
+
+        self.assertEqual(ProductSalesRollup.objects.rebuild(batch_size=2), 3)
+
+        self.assertEqual(
+            dict(ProductSalesRollup.objects.values_list("product", "total_sales")),
+            {self.products[0].pk: 10, self.products[1].pk: 33, self.products[2].pk: 24},
+        )
+
+    def test_stats_for_many_products_take_one_query(self):
+        cache.clear()
+        for product, qty in zip(self.products, (1, 3, 2)):
+            order = self.place_order(product, qty)
+            CartOrder.objects.filter(pk=order.pk).update(payment_status="paid")
+        ids = ",".join(str(product.pk) for product in self.products)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("product-sales-stats-batch"), {"ids": ids}
+            )
+        self.assertEqual([row["total_sales"] for row in response.data], [10, 33, 24])
+
+        # Served from the cache until an order of the product changes status
+        with self.assertNumQueries(0):
+            self.client.get(reverse("product-sales-stats-batch"), {"ids": ids})
+
+        order.payment_status = "refunded"
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        response = self.client.get(
+            reverse("product-sales-stats", args=[self.products[2].pk])
+        )
+        self.assertEqual(response.data["total_sales"], 0)
+        self.assertEqual(response.data["total_returns"], 1)
+
+    def test_item_changes_refresh_stats_and_rollup(self):
+        cache.clear()
+        product = self.products[0]
+        order = self.place_order(product, 2)
+        CartOrder.objects.filter(pk=order.pk).update(
+            payment_status="paid", order_status="Fulfilled"
+        )
+        url = reverse("product-sales-stats", args=[product.pk])
+        self.assertEqual(self.client.get(url).data["total_sales"], 20)
+
+        item = order.orderitem.get()
+        item.qty = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+        self.assertEqual(self.client.get(url).data["total_sales"], 30)
+        self.assertEqual(
+            ProductSalesRollup.objects.get(product=product).total_sales, 30
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.client.get(url).data["total_sales"], 0)
+
+    def test_summary_is_paginated_and_sorted_by_sales(self):
+        for product, qty in zip(self.products, (1, 3, 2)):
+            order = self.place_order(product, qty)
+            CartOrder.objects.filter(pk=order.pk).update(
+                payment_status="paid", order_status="Fulfilled"
+            )
+        ProductSalesRollup.objects.rebuild()
+
+        unsold = make_product("Unsold")
+
+        response = self.client.get(reverse("product-sales-summary"), {"page_size": 2})
+
+        self.assertEqual(response.data["count"], 4)
+        self.assertEqual(
+            [row["product_id"] for row in response.data["results"]],
+            [self.products[1].pk, self.products[2].pk],
+        )
+
+        response = self.client.get(
+            reverse("product-sales-summary"), {"ordering": "total_sales"}
+        )
+        # Products without a rollup row are listed with zeros
+        self.assertEqual(
+            response.data["results"][0],
+            {
+                "product_id": unsold.pk,
+                "product_name": "Unsold",
+                "total_sales": 0.0,
+                "total_orders": 0,
+                "total_customers": 0,
+                "total_returns": 0,
+            },
+        )
+        self.assertEqual(response.data["results"][1]["total_sales"], 10.0)
+
+
+class OrderHistoryTests(APITestCase):
+    def setUp(self):
+        self.admin = make_superuser()
+        self.client.force_authenticate(self.admin)
+        self.product = make_product(stock=1000, weight=100)
+
+    def place_orders(self, count, **fields):
+        for _ in range(count):
+            order = CartOrder.objects.create(
+                user=self.admin,
+                full_name="Admin User",
+                email="admin@example.com",
+                mobile="0700000000",
+                **fields,
+            )
+            CartOrderItem.objects.create(
+                order=order, product=self.product, qty=2, price=10
+            )
+            DeliveryCouriers.objects.create(
+                user=self.admin, cart_order=order, location="Station"
+            )
+
+    def test_query_count_is_constant_per_page(self):
+        counts = []
+        for count in (2, 10):
+            CartOrder.objects.all().delete()
+            self.place_orders(count)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    reverse("list_orders"), {"expand": "orderitem.product"}
+                )
+            self.assertEqual(len(response.data["results"]), count)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        # Items total plus the 4.50 delivery cost of the latest courier
+        self.assertEqual(response.data["results"][0]["total"], 24.5)
+
+    def test_products_are_ids_unless_expanded(self):
+        self.place_orders(1)
+
+        with CaptureQueriesContext(connection) as flat_queries:
+            response = self.client.get(reverse("list_orders"))
+        self.assertEqual(
+            response.data["results"][0]["orderitem"][0]["product"], self.product.pk
+        )
+
+        with CaptureQueriesContext(connection) as expanded_queries:
+            response = self.client.get(
+                reverse("list_orders"), {"expand": "orderitem.product"}
+            )
+        product = response.data["results"][0]["orderitem"][0]["product"]
+        self.assertEqual(product["product_name"], "Product")
+        self.assertLess(len(flat_queries), len(expanded_queries))
+
+    def test_sparse_fields(self):
+        self.place_orders(1)
+
+        response = self.client.get(reverse("list_orders"), {"fields": "oid,total"})
+
+        self.assertEqual(set(response.data["results"][0]), {"oid", "total"})
+
+    def test_grand_total_follows_items_and_courier(self):
+        self.place_orders(1)
+        order = CartOrder.objects.get()
+        self.assertEqual((order.delivery_cost, order.grand_total), (4.5, 24.5))
+
+        # Pushing the order weight past 500g moves it to the next rate
+        item = order.orderitem.get()
+        item.qty = 6
+        item.save()
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.delivery_cost), (60, 5.5))
+        self.assertEqual(order.grand_total, 65.5)
+
+        order.deliverycouriers_set.get().delete()
+        order.refresh_from_db()
+        self.assertEqual((order.delivery_cost, order.grand_total), (0, 60))
+
+    def test_paid_orders_keep_their_delivery_cost(self):
+        self.place_orders(1, payment_status="paid")
+        order = CartOrder.objects.get()
+        self.assertEqual((order.delivery_cost, order.grand_total), (4.5, 24.5))
+
+        item = order.orderitem.get()
+        item.qty = 6
+        item.save()
+        order.deliverycouriers_set.get().save()
+
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.delivery_cost), (60, 4.5))
+        self.assertEqual(order.grand_total, 64.5)
+
+    def test_orders_without_a_stored_grand_total_add_it_up(self):
+        # Paid, so item edits do not requote delivery and resync the total
+        self.place_orders(1, payment_status="paid")
+        order = CartOrder.objects.get()
+        # As left on orders placed before grand_total was stored
+        CartOrder.objects.filter(pk=order.pk).update(grand_total=0)
+
+        response = self.client.get(reverse("list_orders"))
+
+        self.assertEqual(response.data["results"][0]["total"], 24.5)
+
+        # Editing an item fills the stored totals in from every item
+        item = order.orderitem.get()
+        item.qty = 3
+        item.save()
+        order.refresh_from_db()
+        self.assertEqual((order.total, order.grand_total), (30, 34.5))
+
+    def test_orders_are_cursor_paginated_and_filtered(self):
+        self.place_orders(3)
+        self.place_orders(2, payment_status="paid")
+
+        response = self.client.get(reverse("list_orders"), {"page_size": 2})
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIn("cursor=", response.data["next"])
+
+        response = self.client.get(reverse("list_orders"), {"payment_status": "paid"})
+        self.assertEqual(len(response.data["results"]), 2)
+
+        tomorrow = (timezone.now() + timedelta(days=1)).date()
+        response = self.client.get(reverse("list_orders"), {"date_from": tomorrow})
+        self.assertEqual(response.data["results"], [])
+
+    def test_search_spans_every_page(self):
+        self.place_orders(3)
+        CartOrder.objects.filter(
+            pk=CartOrder.objects.order_by("date", "id").values("pk")[:1]
+        ).update(full_name="Jane Roe")
+
+        response = self.client.get(
+            reverse("list_orders"), {"search": "jane", "page_size": 1}
+        )
+
+        self.assertEqual(
+            [row["full_name"] for row in response.data["results"]], ["Jane Roe"]
+        )
+        self.assertIsNone(response.data["next"])
@@ -2,25 +2,41 @@ from django.urls import path
 
 from .views import (
     CartApiView,
+    CartBatchApiView,
     CartDetailView,
     CartItemDeleteView,
     CartListView,
     CartTotalView,
     CheckoutAPIView,
     CreateOrderView,
+    GuestCartView,
     OrderDeleteAPIView,
     OrderDetailAPIView,
     OrderUpdateAPIView,
+    PaymentStatusView,
+    PayPalWebhookView,
     PaymentSuccessView,
     ProductSalesStatsAPIView,
+    ProductSalesStatsBatchAPIView,
     ProductSalesSummaryListAPIView,
     WishlistAPIView,
     WishlistCreateAPIView,
+    WishlistProductIdsView,
 )
 
 urlpatterns = [
     # Create or update a cart item
     path("cart/", CartApiView.as_view(), name="cart-create-update"),
+    # Add several products to the cart in one request
+    path("cart/batch/", CartBatchApiView.as_view(), name="cart-batch-create"),
+    # Anonymous carts kept in the cache until the visitor logs in
+    path("cart/guest/", GuestCartView.as_view(), name="guest-cart-create"),
+    path("cart/guest/<uuid:cart_id>/", GuestCartView.as_view(), name="guest-cart"),
+    path(
+        "cart/guest/<uuid:cart_id>/<int:product_id>/",
+        GuestCartView.as_view(),
+        name="guest-cart-item",
+    ),
     # Get all items for a specific cart ID (with optional user)
     path("cart/<str:cart_id>/", CartListView.as_view(), name="cart-list"),
     # Get total for a specific cart ID (with optional user)
@@ -41,6 +57,12 @@ urlpatterns = [
     path("orders/create/", CreateOrderView.as_view(), name="create-order"),
     path("checkout/<str:order_id>/", CheckoutAPIView.as_view(), name="checkout-view"),
     path("payment-success/", PaymentSuccessView.as_view(), name="payment-success"),
+    path("paypal/webhook/", PayPalWebhookView.as_view(), name="paypal-webhook"),
+    path(
+        "payment-status/<str:order_oid>/",
+        PaymentStatusView.as_view(),
+        name="payment-status",
+    ),
     path("orders/", OrderDetailAPIView.as_view(), name="list_orders"),
  path('orders/update/<int:pk>/', OrderUpdateAPIView.as_view(), name='order-update'),    path("orders/<int:pk>/delete/", OrderDeleteAPIView.as_view(), name="order-delete"),
     path(
@@ -48,11 +70,21 @@ urlpatterns = [
         WishlistCreateAPIView.as_view(),
         name="customer-wishlist-create",
     ),
+    path(
+        "wishlist/ids/",
+        WishlistProductIdsView.as_view(),
+        name="customer-wishlist-ids",
+    ),
     path(
         "wishlist/<user_id>/",
         WishlistAPIView.as_view(),
         name="customer-wishlist",
     ),
+    path(
+        "products/stats/",
+        ProductSalesStatsBatchAPIView.as_view(),
+        name="product-sales-stats-batch",
+    ),
     path(
         "products/<int:product_id>/stats/",
         ProductSalesStatsAPIView.as_view(),
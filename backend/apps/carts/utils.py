@@ -1,15 +1,31 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
-from django.core.mail.backends.smtp import EmailBackend
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import Q
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.html import strip_tags
 
 logger = logging.getLogger(__name__)
 
-from apps.carts.models import CartOrderItem
+from apps.carts.models import CartOrder, CartOrderItem, PayPalWebhookEvent
+from apps.carts.paypal import PayPalError, get_paypal_client
+from apps.common.utils import queue_email
+
+# Give up verifying a webhook event after this many PayPal outages
+MAX_WEBHOOK_ATTEMPTS = 6
+
+# Payment status each PayPal webhook event moves an order to, and the
+# statuses the order may be in for that move to apply.
+WEBHOOK_TRANSITIONS = {
+    "CHECKOUT.ORDER.COMPLETED": ("paid", ["processing"]),
+    "PAYMENT.CAPTURE.COMPLETED": ("paid", ["processing"]),
+    "PAYMENT.CAPTURE.DENIED": ("failed", ["processing"]),
+    "PAYMENT.CAPTURE.REFUNDED": ("refunded", ["paid", "refunding"]),
+    "PAYMENT.CAPTURE.REVERSED": ("refunded", ["paid", "refunding"]),
+}
 
 
 def send_payment_success_email(order):
@@ -18,7 +34,7 @@ def send_payment_success_email(order):
     to = [order.email]
 
     # Get all items in the order
-    order_items = CartOrderItem.objects.filter(order=order)
+    order_items = CartOrderItem.objects.filter(order=order).select_related("product")
 
     context = {
         "full_name": order.full_name,
@@ -31,7 +47,7 @@ def send_payment_success_email(order):
             }
             for item in order_items
         ],
-        "order_total": f"{order.total:.2f}",
+        "order_total": f"{order.amount_due:.2f}",
         "support_email": settings.DEFAULT_FROM_EMAIL,
         "year": datetime.now().year,
     }
@@ -41,4 +57,155 @@ def send_payment_success_email(order):
 
     email = EmailMultiAlternatives(subject, text_content, from_email, to)
     email.attach_alternative(html_content, "text/html")
-    email.send()
+    queue_email(email)
+
+
+def verify_paypal_payment(order, paypal_order_id):
+    """
+    Check a PayPal order and mark the shop order paid once PayPal completed it.
+
+    Safe to call repeatedly, the paid transition and the confirmation email
+    only happen once. Raises PayPalError when PayPal cannot be reached.
+    Returns the PayPal status and whether this call marked the order paid.
+    """
+    paypal_status = get_paypal_client().get_order(paypal_order_id)["status"]
+    # Only orders still awaiting payment take a new PayPal order id
+    CartOrder.objects.filter(pk=order.pk, payment_status="processing").update(
+        paypal_order_id=paypal_order_id, paypal_status=paypal_status
+    )
+
+    marked_paid = paypal_status == "COMPLETED" and order.mark_paid()
+    if marked_paid:
+        try:
+            send_payment_success_email(order)
+        except Exception as e:
+            logger.warning(f"Failed to send email: {str(e)}")
+    return paypal_status, marked_paid
+
+
+def webhook_order_refs(event):
+    """
+    Return the (order oid, PayPal order id) a webhook event refers to.
+
+    The oid comes from the purchase unit custom_id set at checkout.
+    """
+    resource = event.get("resource") or {}
+    purchase_units = resource.get("purchase_units") or [{}]
+    oid = resource.get("custom_id") or purchase_units[0].get("custom_id")
+    if event.get("event_type", "").startswith("CHECKOUT.ORDER."):
+        paypal_order_id = resource.get("id")
+    else:
+        related_ids = (resource.get("supplementary_data") or {}).get("related_ids")
+        paypal_order_id = (related_ids or {}).get("order_id")
+    return oid, paypal_order_id
+
+
+def process_paypal_webhook_events(batch_size=100):
+    """
+    Apply a batch of pending webhook events to their orders' payment status.
+
+    Every event is verified with PayPal first. Events PayPal refuses to
+    verify are rejected, events that hit a PayPal outage are retried with
+    exponential backoff until MAX_WEBHOOK_ATTEMPTS. Events are marked
+    processed with one bulk UPDATE and replays of the same transition are
+    no-ops. Returns the number of events processed.
+    """
+    now = timezone.now()
+    pending = PayPalWebhookEvent.objects.filter(processed_at__isnull=True).filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+    )
+    events = list(pending.order_by("id")[:batch_size])
+    if not events:
+        return 0
+
+    refs = {event.pk: webhook_order_refs(event.payload) for event in events}
+    oids = {oid for oid, _ in refs.values() if oid}
+    paypal_order_ids = {paypal_id for _, paypal_id in refs.values() if paypal_id}
+    orders = list(
+        CartOrder.objects.filter(
+            Q(oid__in=oids) | Q(paypal_order_id__in=paypal_order_ids)
+        )
+    )
+    # Orders without a PayPal order id must never match an event without one
+    by_oid = {order.oid: order for order in orders if order.oid}
+    by_paypal_id = {
+        order.paypal_order_id: order for order in orders if order.paypal_order_id
+    }
+
+    client = get_paypal_client()
+    processed, retried = [], []
+    for event in events:
+        error = None
+        if not (event.headers or {}).get("Paypal-Transmission-Sig"):
+            # Not sent by PayPal at all, do not spend a verification call on it
+            verified = False
+        else:
+            try:
+                verified = (
+                    settings.PAYPAL_WEBHOOK_ID
+                    and client.verify_webhook_signature(
+                        settings.PAYPAL_WEBHOOK_ID, event.headers, event.payload
+                    )
+                )
+            except PayPalError as e:
+                logger.warning(f"Could not verify PayPal event {event.event_id}: {e}")
+                if e.is_client_error:
+                    # PayPal refused the event itself, retrying cannot help
+                    verified = False
+                else:
+                    error = e
+
+        if error is not None:
+            event.attempts += 1
+            if event.attempts < MAX_WEBHOOK_ATTEMPTS:
+                event.next_attempt_at = timezone.now() + timedelta(
+                    minutes=2**event.attempts
+                )
+                retried.append(event)
+                continue
+            event.outcome = "verification_failed"
+            event.processed_at = timezone.now()
+            processed.append(event)
+            continue
+
+        oid, paypal_order_id = refs[event.pk]
+        order = (oid and by_oid.get(oid)) or (
+            paypal_order_id and by_paypal_id.get(paypal_order_id)
+        )
+        transition = WEBHOOK_TRANSITIONS.get(event.event_type)
+        if not verified:
+            event.outcome = "rejected"
+        elif transition is None:
+            event.outcome = "ignored"
+        elif order is None:
+            event.outcome = "unknown_order"
+        else:
+            event.outcome = apply_webhook_transition(order, *transition)
+
+        event.processed_at = timezone.now()
+        processed.append(event)
+
+    PayPalWebhookEvent.objects.bulk_update(
+        processed + retried,
+        ["processed_at", "outcome", "attempts", "next_attempt_at"],
+    )
+    return len(processed)
+
+
+def apply_webhook_transition(order, payment_status, from_statuses):
+    if payment_status == "paid":
+        changed = order.mark_paid()
+        if changed:
+            try:
+                send_payment_success_email(order)
+            except Exception as e:
+                logger.warning(f"Failed to send email: {str(e)}")
+    else:
+        changed = CartOrder.objects.filter(
+            pk=order.pk, payment_status__in=from_statuses
+        ).update(payment_status=payment_status)
+        if changed:
+            order.payment_status = payment_status
+            order.sync_reservations()
+            order.refresh_sales_rollup()
+    return payment_status if changed else "unchanged"
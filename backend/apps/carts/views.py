@@ -1,30 +1,47 @@
 from decimal import Decimal
-from rest_framework.exceptions import NotFound, PermissionDenied
-import requests
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from apps.carts.models import Cart
 from apps.carts.permission import IsAdminOrOwner
+from apps.common.serializers import get_query_list
 from apps.product.models import Product
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models, transaction
-from django.db.models import Count, DecimalField, F, IntegerField, Q, Sum, Value
+from django.db import transaction
+from django.db.models import DecimalField, Value, prefetch_related_objects
 from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django_filters.rest_framework import DjangoFilterBackend
 from loguru import logger
 from rest_framework import generics, status
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Cart, CartOrder, CartOrderItem, Wishlist
+from .models import (
+    Cart,
+    CartOrder,
+    CartOrderItem,
+    PayPalWebhookEvent,
+    Wishlist,
+)
 from .serializers import (
+    CartBatchSerializer,
     CartOrderItem,
     CartOrderSerializer,
     CartSerializer,
+    GuestCartItemSerializer,
+    PaymentStatusSerializer,
     ProductSalesSummarySerializer,
     WishlistCreateSerializer,
 )
-from .utils import send_payment_success_email
+from .filters import OrderFilter
+from .guest import GuestCart
+from .pagination import OrderCursorPagination, SalesSummaryPagination
+from .paypal import PayPalError
+from .tasks import verify_paypal_payment as verify_paypal_payment_task
+from .utils import verify_paypal_payment
 
 User = get_user_model()
 
@@ -35,7 +52,7 @@ class CartApiView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         # Return only carts of the logged-in user
-        return Cart.objects.filter(user=self.request.user)
+        return Cart.objects.filter(user=self.request.user).with_product_card()
 
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
@@ -49,22 +66,8 @@ class CartApiView(generics.ListCreateAPIView):
         product = serializer.validated_data["product"]
         qty = serializer.validated_data["qty"]
 
-        # If cart exists, update qty
-        cart_qs = Cart.objects.filter(user=user, product=product)
-        if cart_qs.exists():
-            cart = cart_qs.first()
-            new_qty = cart.qty + qty
-            if new_qty > product.stock:
-                return Response(
-                    {"qty": f"Total quantity {new_qty} exceeds stock {product.stock}."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            cart.qty = new_qty
-            cart.save()
-            created = False
-        else:
-            cart = serializer.save(user=user)
-            created = True
+        # Create the line or atomically increment its qty, guarded by stock
+        cart, created = Cart.objects.add_item(user, product, qty)
 
         status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
         return Response(
@@ -72,6 +75,56 @@ class CartApiView(generics.ListCreateAPIView):
         )
 
 
+class CartBatchApiView(generics.CreateAPIView):
+    serializer_class = CartBatchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        carts = Cart.objects.add_items(
+            request.user, serializer.validated_data["items"]
+        )
+        prefetch_related_objects(carts, "product__multi_images", "product__tags")
+        return Response(
+            CartSerializer(carts, many=True, context={"request": request}).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class GuestCartView(APIView):
+    """
+    Cart of an anonymous visitor, served from the cache without any query.
+
+    POST adds a product, creating a new cart_id when none is given. The cart
+    is merged into the user's cart when they log in with its guest_cart_id.
+    """
+
+    permission_classes = (AllowAny,)
+
+    def get(self, request, cart_id):
+        return Response(GuestCart(cart_id).to_representation())
+
+    def post(self, request, cart_id=None):
+        serializer = GuestCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        guest_cart = GuestCart(cart_id or data.get("cart_id"))
+        items = guest_cart.add(data["product_id"], data["qty"])
+        return Response(
+            guest_cart.to_representation(items), status=status.HTTP_201_CREATED
+        )
+
+    def delete(self, request, cart_id, product_id=None):
+        guest_cart = GuestCart(cart_id)
+        if product_id is None:
+            guest_cart.clear()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(guest_cart.to_representation(guest_cart.remove(product_id)))
+
+
 class CartListView(generics.ListAPIView):
     serializer_class = CartSerializer
     permission_classes = (AllowAny,)
@@ -82,8 +135,8 @@ class CartListView(generics.ListAPIView):
 
         if user_id:
             user = get_object_or_404(User, id=user_id)
-            return Cart.objects.filter(cart_id=cart_id, user=user)
-        return Cart.objects.filter(cart_id=cart_id)
+            return Cart.objects.filter(cart_id=cart_id, user=user).with_product_card()
+        return Cart.objects.filter(cart_id=cart_id).with_product_card()
 
 
 class CartTotalView(generics.ListAPIView):
@@ -100,14 +153,11 @@ class CartTotalView(generics.ListAPIView):
         return Cart.objects.filter(cart_id=cart_id)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-
-        total = sum([cart.total for cart in queryset])
-        total_qty = sum([cart.qty for cart in queryset])
+        cart_id = self.kwargs["cart_id"]
+        user_id = self.kwargs.get("user_id")
 
-        return Response(
-            {"total_amount": round(float(total), 2), "total_items": total_qty}
-        )
+        user = get_object_or_404(User, id=user_id) if user_id else None
+        return Response(Cart.get_summary(cart_id, user=user))
 
 
 class CartDetailView(generics.RetrieveAPIView):
@@ -121,8 +171,8 @@ class CartDetailView(generics.RetrieveAPIView):
 
         if user_id:
             user = get_object_or_404(User, id=user_id)
-            return Cart.objects.filter(cart_id=cart_id, user=user)
-        return Cart.objects.filter(cart_id=cart_id)
+            return Cart.objects.filter(cart_id=cart_id, user=user).with_product_card()
+        return Cart.objects.filter(cart_id=cart_id).with_product_card()
 
 
 class CartItemDeleteView(generics.DestroyAPIView):
@@ -150,8 +200,10 @@ class CreateOrderView(generics.CreateAPIView):
         data = request.data
         cart_id = data.get("cart_id")
 
-        cart_items = Cart.objects.filter(cart_id=cart_id, user=user)
-        if not cart_items.exists():
+        cart_items = list(
+            Cart.objects.filter(cart_id=cart_id, user=user).select_related("product")
+        )
+        if not cart_items:
             return Response(
                 {"detail": "Cart is empty or invalid cart_id."},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -170,23 +222,7 @@ class CreateOrderView(generics.CreateAPIView):
             "payment_status": "processing",
         }
 
-        with transaction.atomic():
-            order = CartOrder.objects.create(**order_data)
-
-            total = Decimal(0)
-            for item in cart_items:
-                CartOrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    qty=item.qty,
-                    price=item.product.price,
-                    sub_total=item.total,
-                    total=item.total,
-                )
-                total += item.total
-
-            order.total = total
-            order.save()
+        order = CartOrder.objects.create_from_cart(cart_items, **order_data)
 
         return Response(
             {"message": "Order Created Successfully", "order_oid": order.oid},
@@ -226,15 +262,23 @@ class OrderUpdateAPIView(generics.GenericAPIView):
 class OrderDetailAPIView(generics.GenericAPIView):
     serializer_class = CartOrderSerializer
     permission_classes = [IsAuthenticated, IsAdminOrOwner]
-    queryset = CartOrder.objects.all()
-    def get(self, request, *args, **kwargs):
-        user = request.user
+    pagination_class = OrderCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderFilter
+
+    def get_queryset(self):
+        user = self.request.user
+        orders = CartOrder.objects.with_details(
+            expand=get_query_list(self.request, "expand")
+        )
         if user.is_staff:
-            orders = CartOrder.objects.all().order_by("-date")  # Admin sees all
-        else:
-            orders = CartOrder.objects.filter(user=user).order_by("-date")  # Regular user sees only their own
+            return orders  # Admin sees all
+        return orders.filter(user=user)  # Regular user sees only their own
+
+    def get(self, request, *args, **kwargs):
+        orders = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
         serializer = self.get_serializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.get_paginated_response(serializer.data)
 
     def put(self, request, *args, **kwargs):
         # Expecting 'pk' in URL kwargs to identify the order to update
@@ -263,21 +307,12 @@ class CheckoutAPIView(generics.RetrieveAPIView):
     lookup_field = "order_id"
     def get_object(self):
         order_id = self.kwargs["order_id"]
-        order = CartOrder.objects.get(oid=order_id)
+        order = CartOrder.objects.with_details(
+            expand=get_query_list(self.request, "expand")
+        ).get(oid=order_id)
         return order
-    
-def get_access_token(client_id, secret_key):
-    token_url = "https://api.sandbox.paypal.com/v1/oauth2/token"
-    data = {"grant_type": "client_credentials"}
-    auth = (client_id, secret_key)
-    response = requests.post(token_url, data=data, auth=auth)
-    if response.status_code == 200:
-        print("access_token ====", response.json()["access_token"])
-        return response.json()["access_token"]
-    else:
-        raise Exception(
-            f"Failed to get access token from PayPal. Status code: {response.status_code}"
-        )
+
+
 class PaymentSuccessView(generics.CreateAPIView):
     serializer_class = CartOrderSerializer
     queryset = CartOrder.objects.all()
@@ -293,56 +328,106 @@ class PaymentSuccessView(generics.CreateAPIView):
                 {"message": "Order not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        if payapl_order_id != "null":
-            paypal_api_url = (
-                f"https://api-m.sandbox.paypal.com/v2/checkout/orders/{payapl_order_id}"
+        if payapl_order_id == "null":
+            return Response(
+                {"message": "No valid PayPal order ID provided"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {get_access_token(settings.PAYPAL_CLIENT_ID, settings.PAYPAL_SECRET_ID)}",
-            }
-            response = requests.get(paypal_api_url, headers=headers)
-
-            if response.status_code == 200:
-                paypal_order_data = response.json()
-                paypal_payment_status = paypal_order_data["status"]
-
-                if paypal_payment_status == "COMPLETED":
-                    if order.payment_status == "processing":
-                        order.payment_status = "paid"
-                        order.save()
-
-                        # ✅ Send payment success email
-                        # if order.user is not None:
-                        #     send_notification(user=order.user, order=order)
-                        try:
-                            send_payment_success_email(order)
-                        except Exception as e:
-                            logger.warning(f"Failed to send email: {str(e)}")
-
-                        return Response(
-                            {"message": "Payment Successful"},
-                            status=status.HTTP_201_CREATED,
-                        )
-
-                    return Response(
-                        {"message": "Already Paid"}, status=status.HTTP_200_OK
-                    )
 
+        if settings.PAYPAL_VERIFY_ASYNC:
+            # Record the PayPal order and let a worker talk to PayPal. Orders
+            # no longer awaiting payment keep the PayPal order they were paid with.
+            updated = CartOrder.objects.filter(
+                pk=order.pk, payment_status="processing"
+            ).update(paypal_order_id=payapl_order_id, paypal_status=None)
+            if not updated:
                 return Response(
-                    {"message": f"Payment status is '{paypal_payment_status}'"},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {"message": "Order is not awaiting payment"},
+                    status=status.HTTP_409_CONFLICT,
                 )
+            # Queue once the PayPal order id is committed, so the worker reads it
+            transaction.on_commit(
+                lambda: verify_paypal_payment_task.delay(order.pk, payapl_order_id)
+            )
+            return Response(
+                {
+                    "message": "Payment verification queued",
+                    "status_url": request.build_absolute_uri(
+                        reverse("payment-status", args=[order.oid])
+                    ),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
 
+        try:
+            paypal_payment_status, marked_paid = verify_paypal_payment(
+                order, payapl_order_id
+            )
+        except PayPalError as e:
+            logger.warning(f"PayPal verification failed: {str(e)}")
             return Response(
                 {"message": "Failed to verify PayPal payment"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        return Response(
-            {"message": "No valid PayPal order ID provided"},
-            status=status.HTTP_400_BAD_REQUEST,
+        if paypal_payment_status != "COMPLETED":
+            return Response(
+                {"message": f"Payment status is '{paypal_payment_status}'"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if marked_paid:
+            return Response(
+                {"message": "Payment Successful"}, status=status.HTTP_201_CREATED
+            )
+        return Response({"message": "Already Paid"}, status=status.HTTP_200_OK)
+
+
+class PayPalWebhookView(APIView):
+    authentication_classes = []
+    permission_classes = (AllowAny,)
+
+    transmission_headers = [
+        "Paypal-Auth-Algo",
+        "Paypal-Cert-Url",
+        "Paypal-Transmission-Id",
+        "Paypal-Transmission-Sig",
+        "Paypal-Transmission-Time",
+    ]
+
+    def post(self, request, *args, **kwargs):
+        event = request.data
+        if not isinstance(event, dict) or not event.get("id"):
+            return Response(
+                {"message": "Invalid webhook event"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Store the raw event and acknowledge, a Celery worker verifies and
+        # applies it. Retries of the same event are dropped by the unique id.
+        PayPalWebhookEvent.objects.bulk_create(
+            [
+                PayPalWebhookEvent(
+                    event_id=event["id"],
+                    event_type=event.get("event_type", ""),
+                    payload=event,
+                    headers={
+                        name: request.headers.get(name)
+                        for name in self.transmission_headers
+                    },
+                )
+            ],
+            ignore_conflicts=True,
         )
+        return Response(status=status.HTTP_200_OK)
+
+
+class PaymentStatusView(generics.RetrieveAPIView):
+    serializer_class = PaymentStatusSerializer
+    queryset = CartOrder.objects.all()
+    lookup_field = "oid"
+    lookup_url_kwarg = "order_oid"
+    permission_classes = (AllowAny,)
 
 
 class WishlistCreateAPIView(generics.CreateAPIView):
@@ -353,21 +438,28 @@ class WishlistCreateAPIView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         product = serializer.validated_data["product_id"]
-        user = request.user
 
-        existing = Wishlist.objects.filter(product=product, user=user)
-        if existing.exists():
-            existing.delete()
+        if not Wishlist.objects.toggle(request.user, product):
             return Response(
                 {"message": "Removed from wishlist"}, status=status.HTTP_200_OK
             )
-
-        Wishlist.objects.create(product=product, user=user)
         return Response(
             {"message": "Added to wishlist"}, status=status.HTTP_201_CREATED
         )
 
 
+class WishlistProductIdsView(APIView):
+    """
+    Ids of the products in the current user's wishlist, for listing badges.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        product_ids = Wishlist.get_product_ids(request.user)
+        return Response({"product_ids": sorted(product_ids)})
+
+
 class WishlistAPIView(generics.ListAPIView):
     serializer_class = WishlistCreateSerializer
     permission_classes = (AllowAny,)
@@ -377,123 +469,65 @@ class WishlistAPIView(generics.ListAPIView):
         user = User.objects.get(id=user_id)
         wishlist = Wishlist.objects.filter(
             user=user,
-        )
+        ).with_product_card()
         return wishlist
 
 
 class ProductSalesStatsAPIView(APIView):
     def get(self, request, product_id):
-        # Filter order items with the given product
-        order_items = CartOrderItem.objects.filter(product_id=product_id)
-
-        # Filter only orders that are paid or fulfilled for sales and orders
-        valid_orders = CartOrder.objects.filter(
-            Q(payment_status="paid") | Q(order_status="Fulfilled")
-        )
+        stats = CartOrderItem.get_sales_stats([product_id])
+        return Response(stats[product_id])
 
-        # Order items linked to valid orders
-        valid_order_items = order_items.filter(order__in=valid_orders)
 
-        total_sales_agg = valid_order_items.aggregate(total_sales=Sum("total"))
-        total_sales = total_sales_agg["total_sales"] or 0
+class ProductSalesStatsBatchAPIView(APIView):
+    """
+    Sales stats for several products at once, e.g. ?ids=1,2,3
+    """
 
-        # Total orders with that product and valid status
-        total_orders = (
-            valid_orders.filter(orderitem__product_id=product_id).distinct().count()
-        )
+    max_products = 100
 
-        # Total distinct customers who ordered the product
-        total_customers = (
-            valid_orders.filter(orderitem__product_id=product_id)
-            .values("user_id")
-            .distinct()
-            .count()
-        )
-
-        # Calculate returns = orders with product which are cancelled or refunded
-        returns_orders = (
-            CartOrder.objects.filter(
-                Q(order_status="Cancelled")
-                | Q(payment_status__in=["refunded", "refunding"])
+    def get(self, request):
+        try:
+            product_ids = list(
+                dict.fromkeys(
+                    int(pk) for pk in request.query_params.get("ids", "").split(",")
+                )
+            )
+        except ValueError:
+            raise ValidationError({"ids": "Provide a comma separated list of ids."})
+        if len(product_ids) > self.max_products:
+            raise ValidationError(
+                {"ids": f"Request at most {self.max_products} products at a time."}
             )
-            .filter(orderitem__product_id=product_id)
-            .distinct()
-        )
 
-        total_returns = returns_orders.count()
+        stats = CartOrderItem.get_sales_stats(product_ids)
+        return Response([stats[product_id] for product_id in product_ids])
 
-        return Response(
-            {
-                "product_id": product_id,
-                "total_sales": total_sales,
-                "total_orders": total_orders,
-                "total_customers": total_customers,
-                "total_returns": total_returns,
-            }
-        )
 
+class ProductSalesSummaryListAPIView(generics.ListAPIView):
+    serializer_class = ProductSalesSummarySerializer
+    pagination_class = SalesSummaryPagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = [
+        "total_sales",
+        "total_orders",
+        "total_customers",
+        "total_returns",
+    ]
+    ordering = ["-total_sales", "id"]
 
-class ProductSalesSummaryListAPIView(APIView):
-    def get(self, request):
-        # Annotate all products with aggregated sales/order info:
-        products = Product.objects.all().annotate(
-            total_sales=Coalesce(
-                Sum(
-                    "order_items__total",
-                    filter=Q(order_items__order__order_status="Fulfilled")
-                    & Q(order_items__order__payment_status="paid"),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                ),
-                0,
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            total_orders=Coalesce(
-                Count(
-                    "order_items__order",
-                    distinct=True,
-                    filter=Q(order_items__order__order_status="Fulfilled")
-                    & Q(order_items__order__payment_status="paid"),
-                    output_field=IntegerField(),
-                ),
-                0,
-                output_field=IntegerField(),
-            ),
-            total_customers=Coalesce(
-                Count(
-                    "order_items__order__user",
-                    distinct=True,
-                    filter=Q(order_items__order__order_status="Fulfilled")
-                    & Q(order_items__order__payment_status="paid"),
-                    output_field=IntegerField(),
-                ),
-                0,
-                output_field=IntegerField(),
-            ),
-            total_returns=Coalesce(
-                Count(
-                    "order_items",
-                    filter=Q(
-                        order_items__order__order_status__in=["Cancelled", "Refunded"]
-                    ),
-                    output_field=IntegerField(),
-                ),
-                0,
-                output_field=IntegerField(),
+    def get_queryset(self):
+        # Read the precomputed rollup instead of aggregating every order item.
+        # It is left joined, so products without a rollup row yet count as 0.
+        def rollup(field, default):
+            return Coalesce(f"sales_rollup__{field}", default)
+
+        return Product.objects.annotate(
+            total_sales=rollup(
+                "total_sales",
+                Value(Decimal("0.00"), output_field=DecimalField()),
             ),
+            total_orders=rollup("total_orders", 0),
+            total_customers=rollup("total_customers", 0),
+            total_returns=rollup("total_returns", 0),
         )
-
-        # Prepare response data and convert Decimal to float
-        results = [
-            {
-                "product_id": product.id,
-                "product_name": product.product_name,
-                "total_sales": float(product.total_sales),
-                "total_orders": product.total_orders,
-                "total_customers": product.total_customers,
-                "total_returns": product.total_returns,
-            }
-            for product in products
-        ]
-
-        serializer = ProductSalesSummarySerializer(results, many=True)
-        return Response(serializer.data)
@@ -0,0 +1,52 @@
+def get_query_list(request, param):
+    """
+    Parse a comma separated query parameter such as ?expand=a,b into a set.
+    """
+    if request is None:
+        return set()
+    value = request.query_params.get(param, "")
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+class ExpandableFieldsMixin:
+    """
+    Let requests choose the shape of a ModelSerializer's output.
+
+    Relations are rendered as flat ids unless they are listed in ?expand=,
+    where nested relations use dotted paths (?expand=orderitem.product).
+    ?fields= limits the top-level fields a GET returns. The choice is made per
+    serializer instance, so concurrent requests never affect each other.
+
+    expandable_fields maps a field name to the serializer class used when
+    that field is expanded.
+    """
+
+    expandable_fields = {}
+
+    def get_field_path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return ".".join(reversed(names))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        path = self.get_field_path()
+        prefix = f"{path}." if path else ""
+
+        expand = get_query_list(request, "expand")
+        for name, serializer_class in self.expandable_fields.items():
+            if name in fields and f"{prefix}{name}" in expand:
+                fields[name] = serializer_class(read_only=True)
+
+        # Only trim reads, writes still need every input field
+        requested = get_query_list(request, "fields")
+        if requested and not path and request.method == "GET":
+            fields = {
+                name: field for name, field in fields.items() if name in requested
+            }
+        return fields
@@ -0,0 +1,14 @@
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def send_queued_emails(batch_size=50):
+    from apps.common.utils import send_queued_emails
+
+    sent = send_queued_emails(batch_size=batch_size)
+    logger.info(f"Sent {sent} queued emails.")
+    return sent
@@ -0,0 +1,50 @@
+"""
+Factories shared by the app test suites.
+"""
+
+from django.contrib.auth import get_user_model
+
+from apps.product.models import Product
+
+User = get_user_model()
+
+PRODUCT_DEFAULTS = {
+    "description": "Description",
+    "seller_notes": "Notes",
+    "material": "Cotton",
+    "price": 10,
+    "stock": 10,
+}
+
+
+def make_user(username="buyer", **fields):
+    fields = {
+        "first_name": "Test",
+        "last_name": "User",
+        "email": f"{username}@example.com",
+        "password": "testpass123",
+        **fields,
+    }
+    return User.objects.create_user(username=username, **fields)
+
+
+def make_superuser(username="admin", **fields):
+    fields = {
+        "first_name": "Admin",
+        "last_name": "User",
+        "email": f"{username}@example.com",
+        "password": "testpass123",
+        **fields,
+    }
+    return User.objects.create_superuser(username=username, **fields)
+
+
+def build_product(name="Product", **fields):
+    """
+    Unsaved product with placeholder values, e.g. for bulk_create.
+    """
+    return Product(product_name=name, **{**PRODUCT_DEFAULTS, **fields})
+
+
+def make_product(name="Product", **fields):
+    return Product.objects.create(product_name=name, **{**PRODUCT_DEFAULTS, **fields})
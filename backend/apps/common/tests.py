@@ -1,3 +1,95 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.common.models import OutboxEmail
+from apps.common.utils import (
+    EMAIL_CLAIM_TIMEOUT,
+    MAX_EMAIL_ATTEMPTS,
+    queue_email,
+    send_queued_emails,
+)
+
+
+class OutboxEmailTests(TestCase):
+    def queue(self, to="buyer@example.com"):
+        message = EmailMultiAlternatives("Subject", "Body", "shop@example.com", [to])
+        message.attach_alternative("<p>Body</p>", "text/html")
+        return queue_email(message)
+
+    def test_batch_is_sent_over_one_connection(self):
+        for i in range(3):
+            self.queue(f"buyer{i}@example.com")
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.open"
+        ) as open_connection:
+            self.assertEqual(send_queued_emails(), 3)
+
+        open_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][0], "<p>Body</p>")
+        self.assertFalse(
+            OutboxEmail.objects.exclude(status=OutboxEmail.Status.SENT).exists()
+        )
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_html_message_keeps_content_subtype(self):
+        message = EmailMessage("Subject", "<p>Body</p>", to=["buyer@example.com"])
+        message.content_subtype = "html"
+        queue_email(message)
+
+        send_queued_emails()
+
+        self.assertEqual(mail.outbox[0].content_subtype, "html")
+
+    def test_failed_email_is_retried_with_backoff(self):
+        email = self.queue()
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=OSError("connection reset"),
+        ):
+            self.assertEqual(send_queued_emails(), 0)
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.Status.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.send_after, timezone.now())
+        # Not due yet, so the next run leaves it alone
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_email_fails_after_max_attempts(self):
+        email = self.queue()
+        OutboxEmail.objects.filter(pk=email.pk).update(attempts=MAX_EMAIL_ATTEMPTS - 1)
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=OSError("connection reset"),
+        ):
+            send_queued_emails()
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.Status.FAILED)
+        self.assertEqual(email.last_error, "connection reset")
+
+    def test_claimed_emails_are_not_sent_twice(self):
+        email = self.queue()
+        OutboxEmail.objects.filter(pk=email.pk).update(
+            status=OutboxEmail.Status.SENDING, claimed_at=timezone.now()
+        )
+
+        # Another worker is sending it
+        self.assertEqual(send_queued_emails(), 0)
 
-# Create your tests here.
+        # That worker died, the claim is taken over once it is stale
+        OutboxEmail.objects.filter(pk=email.pk).update(
+            claimed_at=timezone.now() - EMAIL_CLAIM_TIMEOUT - timedelta(minutes=1)
+        )
+        self.assertEqual(send_queued_emails(), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.Status.SENT)
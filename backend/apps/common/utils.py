@@ -0,0 +1,126 @@
+import logging
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.common.models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+# Give up on an email after this many failed delivery attempts
+MAX_EMAIL_ATTEMPTS = 5
+
+# An email claimed for this long without a result is claimed again
+EMAIL_CLAIM_TIMEOUT = timedelta(minutes=15)
+
+
+def queue_email(message):
+    """
+    Store an EmailMessage in the outbox instead of sending it in the request.
+    """
+    html_body = next(
+        (
+            content
+            for content, mimetype in getattr(message, "alternatives", [])
+            if mimetype == "text/html"
+        ),
+        "",
+    )
+    return OutboxEmail.objects.create(
+        subject=message.subject,
+        body=message.body,
+        html_body=html_body,
+        content_subtype=message.content_subtype,
+        from_email=message.from_email or "",
+        to=list(message.to),
+    )
+
+
+def claim_queued_emails(batch_size=50):
+    """
+    Mark a batch of due outbox emails as sending and return them.
+
+    The rows are locked only for this short transaction. Claims older than
+    EMAIL_CLAIM_TIMEOUT belong to a worker that died mid-send and are taken
+    over, so an email may go out twice but is never lost.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.filter(
+                Q(status=OutboxEmail.Status.PENDING, send_after__lte=now)
+                | Q(
+                    status=OutboxEmail.Status.SENDING,
+                    claimed_at__lt=now - EMAIL_CLAIM_TIMEOUT,
+                )
+            )
+            .select_for_update(skip_locked=True)
+            .order_by("send_after")[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            status=OutboxEmail.Status.SENDING, claimed_at=now, updated_at=now
+        )
+    return emails
+
+
+def send_queued_emails(batch_size=50):
+    """
+    Deliver a batch of due outbox emails over a single SMTP connection.
+
+    Emails are claimed first and sent outside of any transaction, each
+    result is then recorded with its own UPDATE. Failed emails are retried
+    with exponential backoff until they reach MAX_EMAIL_ATTEMPTS. Returns
+    the number of emails sent.
+    """
+    emails = claim_queued_emails(batch_size)
+    if not emails:
+        return 0
+
+    sent = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # Could not reach the mail server, retry the whole batch later
+        for email in emails:
+            mark_email_failed(email, e)
+        return 0
+
+    try:
+        for email in emails:
+            try:
+                connection.send_messages([email.to_message(connection)])
+            except Exception as e:
+                mark_email_failed(email, e)
+            else:
+                mark_email_sent(email)
+                sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def mark_email_sent(email):
+    now = timezone.now()
+    OutboxEmail.objects.filter(pk=email.pk).update(
+        status=OutboxEmail.Status.SENT, sent_at=now, updated_at=now
+    )
+
+
+def mark_email_failed(email, error):
+    attempts = email.attempts + 1
+    changes = {
+        "attempts": attempts,
+        "last_error": str(error),
+        "updated_at": timezone.now(),
+    }
+    if attempts >= MAX_EMAIL_ATTEMPTS:
+        changes["status"] = OutboxEmail.Status.FAILED
+        logger.warning(f"Giving up on email {email.pk} to {email.to}: {error}")
+    else:
+        changes["status"] = OutboxEmail.Status.PENDING
+        changes["send_after"] = timezone.now() + timedelta(minutes=2**attempts)
+    OutboxEmail.objects.filter(pk=email.pk).update(**changes)
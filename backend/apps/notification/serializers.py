@@ -1,24 +1,22 @@
+from apps.carts.serializers import CartOrderItemSerializer, CartOrderSerializer
+from apps.common.serializers import ExpandableFieldsMixin
+from apps.users.serializers import UserSerializer
 from rest_framework import serializers
 
 from .models import Contact, Notification
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        "user": UserSerializer,
+        "order": CartOrderSerializer,
+        "order_item": CartOrderItemSerializer,
+    }
+
     class Meta:
         model = Notification
         fields = ["id", "user", "order", "order_item", "seen", "date"]
 
-    def __init__(self, *args, **kwargs):
-        super(NotificationSerializer, self).__init__(*args, **kwargs)
-        # Customize serialization depth based on the request method.
-        request = self.context.get("request")
-        if request and request.method == "POST":
-            # When creating a new coupon user, set serialization depth to 0.
-            self.Meta.depth = 0
-        else:
-            # For other methods, set serialization depth to 3.
-            self.Meta.depth = 3
-
 
 class ContactSerializer(serializers.ModelSerializer):
     class Meta:
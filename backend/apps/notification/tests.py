@@ -1,3 +1,38 @@
-from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from apps.carts.models import CartOrder, CartOrderItem
+from apps.common.testing import make_product, make_user
+from apps.notification.models import Notification
+
+
+class CustomerNotificationViewTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        product = make_product()
+        self.order = CartOrder.objects.create(
+            user=self.user,
+            full_name="Test User",
+            email="buyer@example.com",
+            mobile="0700000000",
+        )
+        CartOrderItem.objects.create(order=self.order, product=product, price=10)
+        Notification.objects.create(user=self.user, order=self.order)
+        self.url = reverse("customer-notification", args=[self.user.id])
+
+    def test_relations_are_ids_by_default(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data[0]["order"], self.order.pk)
+        self.assertEqual(response.data[0]["user"], self.user.pk)
+
+    def test_nested_relations_can_be_expanded(self):
+        response = self.client.get(
+            self.url, {"expand": "order,order.orderitem.product"}
+        )
+
+        order = response.data[0]["order"]
+        self.assertEqual(order["oid"], self.order.oid)
+        self.assertEqual(order["orderitem"][0]["product"]["product_name"], "Product")
+        # Expansion is per request, the next plain request is flat again
+        self.assertEqual(self.client.get(self.url).data[0]["order"], self.order.pk)
@@ -1,4 +1,7 @@
+from apps.carts.models import CartOrder
+from apps.common.serializers import get_query_list
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from django.shortcuts import render
 from rest_framework import generics, permissions
 
@@ -25,7 +28,30 @@ class CustomerNotificationView(generics.ListAPIView):
     def get_queryset(self):
         user_id = self.kwargs["user_id"]
         user = User.objects.get(id=user_id)
-        return Notification.objects.filter(user=user)
+        notifications = Notification.objects.filter(user=user)
+
+        # Only join the relations the response expands
+        expand = get_query_list(self.request, "expand")
+        if "user" in expand:
+            notifications = notifications.select_related("user__profile")
+        if "order" in expand:
+            order_expand = {
+                path.removeprefix("order.")
+                for path in expand
+                if path.startswith("order.")
+            }
+            notifications = notifications.prefetch_related(
+                Prefetch("order", queryset=CartOrder.objects.with_details(order_expand))
+            )
+        if "order_item" in expand:
+            notifications = notifications.select_related("order_item")
+            if "order_item.product" in expand:
+                notifications = notifications.select_related(
+                    "order_item__product"
+                ).prefetch_related(
+                    "order_item__product__multi_images", "order_item__product__tags"
+                )
+        return notifications
 
 
 class ContactCreateAPIView(generics.ListCreateAPIView):
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from .models import DeliveryCouriers, MultiProductImages, Product
+from .models import DeliveryCouriers, DeliveryRate, MultiProductImages, Product
 
 admin.site.register(Product)
 admin.site.register(MultiProductImages)
 admin.site.register(DeliveryCouriers)
+admin.site.register(DeliveryRate)
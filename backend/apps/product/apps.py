@@ -1,8 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 from django.utils.translation import gettext_lazy as _
 
 class ProductConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.product'
     verbose_name = _("Product")
-    
\ No newline at end of file
+
+    def ready(self):
+        from apps.product import signals
+        from apps.product.search import create_search_index
+
+        # The search table is raw SQL, so it is created after every migrate
+        post_migrate.connect(create_search_index, sender=self)
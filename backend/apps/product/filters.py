@@ -1,8 +1,13 @@
+import hashlib
+from urllib.parse import urlencode
+
 import django_filters
+from rest_framework.filters import SearchFilter
 from taggit.models import Tag
 from taggit.serializers import TagListSerializerField
 
-from .models import Product
+from .models import Product, ProductAttribute
+from .search import search_products
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -15,23 +20,64 @@ class ProductFilter(django_filters.FilterSet):
     attributes = django_filters.CharFilter(method="filter_attributes")
 
     tags = django_filters.CharFilter(method="filter_tags")
+    tags_all = django_filters.CharFilter(method="filter_tags")
 
     def filter_attributes(self, queryset, name, value):
-
-        from django.db.models import Q
-
-        filters = Q()
+        # Each key:value pair is an indexed lookup on the attribute side
+        # table, several pairs intersect their product ids
         for item in value.split(","):
             if ":" in item:
-                key, val = item.split(":")
-                filters &= Q(**{f"attributes__{key.strip()}": val.strip()})
-        return queryset.filter(filters)
+                key, val = item.split(":", 1)
+                queryset = queryset.filter(
+                    pk__in=ProductAttribute.objects.matching(key.strip(), val.strip())
+                )
+        return queryset
 
     def filter_tags(self, queryset, name, value):
-
-        tags = value.split(",")
-        return queryset.filter(tags__name__in=tags).distinct()
+        # ?tags= matches any of the tags, ?tags_all= requires every one
+        tags = [tag.strip() for tag in value.split(",")]
+        return queryset.with_tags(tags, match_all=name == "tags_all")
 
     class Meta:
         model = Product
-        fields = ["price_min", "price_max", "condition", "type", "tags"]
+        fields = ["price_min", "price_max", "condition", "type", "tags", "tags_all"]
+
+
+def product_filter_signature(query_params, search_param="search"):
+    """
+    Stable digest of the ProductFilter and search parameters of a request.
+
+    Unrelated parameters such as the page are ignored, and the order of keys
+    and of comma separated values does not change the signature.
+    """
+    params = []
+    for key in sorted(set(ProductFilter.base_filters) | {search_param}):
+        values = sorted(
+            {
+                item.strip().lower() if key == search_param else item.strip()
+                for value in query_params.getlist(key)
+                for item in value.split(",")
+            }
+            - {""}
+        )
+        if values:
+            params.append((key, ",".join(values)))
+    return hashlib.md5(urlencode(params).encode()).hexdigest()
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    ?search= backed by the full-text index, ranked by relevance.
+
+    Falls back to the icontains search over search_fields on databases
+    without full-text support.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+        results = search_products(queryset, query)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        return results
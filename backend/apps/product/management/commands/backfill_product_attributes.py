@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.product.models import Product, ProductAttribute
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProductAttribute rows from Product.attributes in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of products synced per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        products = Product.objects.order_by("pk").only("pk", "attributes")
+        last_pk, synced, rows = 0, 0, 0
+
+        while True:
+            batch = list(products.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                rows += len(ProductAttribute.objects.sync(batch))
+            synced += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Synced {rows} attribute values for {synced} products.")
+        )
@@ -2,7 +2,7 @@ import random
 
 from django.core.management.base import BaseCommand
 
-from apps.product.models import Brand, Category, Product
+from apps.product.models import Brand, Category, Product, ProductAttribute
 
 
 class Command(BaseCommand):
@@ -54,6 +54,8 @@ class Command(BaseCommand):
 
         # Create the products in bulk (M2M not yet saved)
         Product.objects.bulk_create(products)
+        # bulk_create skips Product.save, so fill the attribute table here
+        ProductAttribute.objects.sync(products)
         self.stdout.write(self.style.SUCCESS("Successfully created 500 products!"))
 
         # Fetch the most recently created 500 products
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.search import get_search_backend, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from the product table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of products indexed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        if get_search_backend() is None:
+            self.stdout.write(
+                "The database has no full-text search support, nothing to rebuild."
+            )
+            return
+
+        indexed = rebuild_search_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from apps.carts.models import CartOrder
+from apps.product.models import REQUOTABLE_PAYMENT_STATUSES, DeliveryCouriers
+
+
+class Command(BaseCommand):
+    help = "Requote the delivery cost of unpaid orders against the current rates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of orders requoted per batch.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Requote every order, including paid ones.",
+        )
+        parser.add_argument(
+            "--orders",
+            nargs="+",
+            metavar="OID",
+            help="Only requote these orders.",
+        )
+
+    def handle(self, *args, **options):
+        orders = CartOrder.objects.all()
+        if not options["all"]:
+            orders = orders.filter(payment_status__in=REQUOTABLE_PAYMENT_STATUSES)
+        if options["orders"]:
+            orders = orders.filter(oid__in=options["orders"])
+        order_ids = orders.order_by("pk").values_list("pk", flat=True)
+
+        requoted = DeliveryCouriers.objects.requote(
+            order_ids, batch_size=options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Requoted delivery for {requoted} orders.")
+        )
@@ -1,9 +1,25 @@
+import copy
+import time
 from decimal import Decimal
 
-from apps.carts.models import CartOrder
+from apps.carts.models import REQUOTABLE_PAYMENT_STATUSES, CartOrder, Wishlist
 from apps.category.models import Category
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Value,
+    When,
+)
+from django.utils import timezone
 from taggit.managers import TaggableManager
 
 User = get_user_model()
@@ -18,6 +34,228 @@ class Brand(models.Model):
         return self.name
 
 
+# Facet counts are cached per filter signature under a version that every
+# product write bumps, so stale counts are never read back
+PRODUCT_FACETS_VERSION_KEY = "product:facets:version"
+PRODUCT_FACETS_CACHE_TIMEOUT = 60 * 10
+
+# Lower bounds of the price buckets reported by the catalog facets
+PRICE_FACET_BUCKETS = (0, 50, 100, 250, 500, 1000)
+
+# Only the most used tags of a selection are reported
+TAG_FACET_LIMIT = 50
+
+
+# Inverted tag index: the sorted ids of the products carrying each tag
+TAG_INDEX_CACHE_TIMEOUT = 60 * 60
+
+# Above this many ids the tag filter is a subquery, keeping the id list far
+# below the database's limit on query parameters
+TAG_INDEX_MAX_IDS = 1000
+
+
+def tag_index_cache_key(tag_name):
+    return f"product:tag_index:{tag_name}"
+
+
+def product_facets_cache_key(signature):
+    version = cache.get(PRODUCT_FACETS_VERSION_KEY)
+    if version is None:
+        version = Product.objects.bump_facets_version()
+    return f"product:facets:{version}:{signature}"
+
+
+class ProductQuerySet(models.QuerySet):
+    @staticmethod
+    def _per_product(quantities):
+        return Case(
+            *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+            output_field=IntegerField(),
+        )
+
+    def take_stock(self, quantities):
+        """
+        Decrement stock by {product_id: qty} in one conditional UPDATE.
+
+        Returns True only if every product had enough stock. Products that did
+        are still decremented, so callers must roll back the transaction when
+        this returns False.
+        """
+        if not quantities:
+            return True
+        amount = self._per_product(quantities)
+        updated = self.filter(pk__in=quantities, stock__gte=amount).update(
+            stock=F("stock") - amount
+        )
+        return updated == len(quantities)
+
+    def restore_stock(self, quantities):
+        """
+        Increment stock by {product_id: qty} in one UPDATE.
+        """
+        if quantities:
+            amount = self._per_product(quantities)
+            self.filter(pk__in=quantities).update(stock=F("stock") + amount)
+
+    def for_catalog(self, user=None):
+        """
+        Load everything ProductSerializer needs in a fixed number of queries,
+        whatever the page size: images and tags are prefetched, and for a
+        signed-in user one subquery marks the products in their wishlist.
+        """
+        queryset = self.prefetch_related("multi_images", "tags")
+        if user is not None and user.is_authenticated:
+            queryset = queryset.annotate(
+                in_wishlist=Exists(
+                    Wishlist.objects.filter(user=user, product=OuterRef("pk"))
+                )
+            )
+        return queryset
+
+    def tagged_ids(self, tag_names):
+        """
+        {tag_name: sorted product ids} from the cached inverted tag index.
+
+        Tags missing from the cache are loaded together with one query on the
+        taggit through table and cached for the next request.
+        """
+        tag_names = set(tag_names)
+        keys = {tag_index_cache_key(name): name for name in tag_names}
+        index = {keys[key]: ids for key, ids in cache.get_many(keys).items()}
+
+        missing = tag_names - set(index)
+        if missing:
+            loaded = {name: [] for name in missing}
+            tagged_items = (
+                self._tagged_items(missing)
+                .order_by("object_id")
+                .values_list("tag__name", "object_id")
+            )
+            for name, product_id in tagged_items:
+                loaded[name].append(product_id)
+            cache.set_many(
+                {tag_index_cache_key(name): ids for name, ids in loaded.items()},
+                TAG_INDEX_CACHE_TIMEOUT,
+            )
+            index.update(loaded)
+        return index
+
+    def _tagged_items(self, tag_names):
+        return self.model.tags.through.objects.filter(
+            content_type=ContentType.objects.get_for_model(self.model),
+            tag__name__in=tag_names,
+        )
+
+    def with_tags(self, tag_names, match_all=False):
+        """
+        Products tagged with any of tag_names, or with all of them when
+        match_all is set, resolved from the inverted index without a join.
+
+        Selections of more than TAG_INDEX_MAX_IDS products are filtered with
+        subqueries on the taggit through table instead.
+        """
+        tag_names = [name for name in tag_names if name]
+        if not tag_names:
+            return self
+        id_sets = [set(ids) for ids in self.tagged_ids(tag_names).values()]
+        if match_all:
+            product_ids = set.intersection(*id_sets)
+        else:
+            product_ids = set.union(*id_sets)
+        if len(product_ids) <= TAG_INDEX_MAX_IDS:
+            return self.filter(pk__in=sorted(product_ids))
+
+        if not match_all:
+            return self.filter(pk__in=self._tagged_items(tag_names).values("object_id"))
+        queryset = self
+        for name in set(tag_names):
+            queryset = queryset.filter(
+                pk__in=self._tagged_items([name]).values("object_id")
+            )
+        return queryset
+
+    def invalidate_tag_index(self, tag_names):
+        """
+        Drop the cached entries of tag_names, they are reloaded on next read.
+        """
+        cache.delete_many([tag_index_cache_key(name) for name in tag_names])
+
+    def bump_facets_version(self):
+        version = time.time_ns()
+        cache.set(PRODUCT_FACETS_VERSION_KEY, version, None)
+        return version
+
+    def facets(self):
+        """
+        Counts per condition, type, category, tag and price bucket for the
+        products in this queryset, with one grouped query per facet.
+        """
+        # Filters may join tags or order by rank, so group over plain ids
+        products = self.model.objects.filter(pk__in=self.order_by().values("pk"))
+
+        def grouped(*fields):
+            return (
+                products.filter(**{f"{fields[0]}__isnull": False})
+                .values(*fields)
+                .annotate(count=Count("pk", distinct=True))
+                .order_by("-count", fields[0])
+            )
+
+        conditions = dict(self.model.ConditionChoices.choices)
+        types = dict(self.model.TypeChoices.choices)
+        edges = PRICE_FACET_BUCKETS + (None,)
+        buckets = list(zip(edges, edges[1:]))
+        prices = products.aggregate(
+            **{
+                f"bucket_{low}": Count(
+                    "pk",
+                    filter=Q(price__gte=low)
+                    & (Q(price__lt=high) if high is not None else Q()),
+                )
+                for low, high in buckets
+            }
+        )
+
+        return {
+            "condition": [
+                {
+                    "value": row["condition"],
+                    "label": conditions.get(row["condition"], row["condition"]),
+                    "count": row["count"],
+                }
+                for row in grouped("condition")
+            ],
+            "type": [
+                {
+                    "value": row["type"],
+                    "label": types.get(row["type"], row["type"]),
+                    "count": row["count"],
+                }
+                for row in grouped("type")
+            ],
+            "category": [
+                {
+                    "value": row["category"],
+                    "label": row["category__name"],
+                    "count": row["count"],
+                }
+                for row in grouped("category", "category__name")
+            ],
+            "tags": [
+                {
+                    "value": row["tags__name"],
+                    "label": row["tags__name"],
+                    "count": row["count"],
+                }
+                for row in grouped("tags__name")[:TAG_FACET_LIMIT]
+            ],
+            "price": [
+                {"min": low, "max": high, "count": prices[f"bucket_{low}"]}
+                for low, high in buckets
+            ],
+        }
+
+
 class Product(models.Model):
     class ConditionChoices(models.TextChoices):
         NW = "New", "New"
@@ -58,9 +296,101 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self) -> str:
         return self.product_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "attributes" in instance.__dict__:
+            # A copy, so in-place edits of the dict still count as changes
+            instance._saved_attributes = copy.deepcopy(instance.attributes)
+        return instance
+
+    def save(self, *args, **kwargs):
+        attributes_changed = self._state.adding or (
+            getattr(self, "_saved_attributes", None) != self.attributes
+        )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if attributes_changed:
+                ProductAttribute.objects.sync([self])
+        self._saved_attributes = copy.deepcopy(self.attributes)
+
+
+class ProductAttributeQuerySet(models.QuerySet):
+    @staticmethod
+    def rows_for(product):
+        """
+        (name, value) pairs of a product's attributes JSON, one per list item.
+
+        Values are stored as text the way they are written in a filter, so
+        42 becomes "42" and true becomes "true". Nested objects are skipped.
+        """
+        rows = set()
+        for name, value in (product.attributes or {}).items():
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, bool):
+                    item = "true" if item else "false"
+                elif item is None or isinstance(item, (dict, list)):
+                    continue
+                rows.add((str(name)[:100], str(item)[:255]))
+        return rows
+
+    def sync(self, products):
+        """
+        Replace the attribute rows of the given products with one DELETE and
+        one bulk INSERT.
+        """
+        self.filter(product__in=[product.pk for product in products]).delete()
+        return self.bulk_create(
+            [
+                self.model(product=product, name=name, value=value)
+                for product in products
+                for name, value in self.rows_for(product)
+            ]
+        )
+
+    def matching(self, name, value):
+        """
+        Ids of the products with this attribute value, served by the
+        (name, value, product) index.
+        """
+        return self.filter(name=name, value=value).values("product")
+
+
+class ProductAttribute(models.Model):
+    """
+    One row per attribute value of a product, mirroring Product.attributes
+    so attribute filters can use an index instead of scanning the JSON.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="attribute_rows"
+    )
+    name = models.CharField(max_length=100)
+    value = models.CharField(max_length=255)
+
+    objects = ProductAttributeQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "name", "value"],
+                name="unique_product_attribute_value",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["name", "value", "product"], name="product_attr_lookup_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.name}={self.value}"
+
 
 class MultiProductImages(models.Model):
     product = models.ForeignKey(
@@ -71,10 +401,164 @@ class MultiProductImages(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
 
+class DeliveryType(models.TextChoices):
+    LOCATION = "location", "Home Location"
+    STATION = "station", "Close Station"
+
+
+# Rates used for delivery types without rows in the DeliveryRate table, as
+# {delivery_type: [(max_weight, cost), ...]} with weights in grams.
+DEFAULT_DELIVERY_RATES = {
+    DeliveryType.LOCATION: [
+        (Decimal("500"), Decimal("4.50")),
+        (Decimal("1000"), Decimal("5.50")),
+        (Decimal("2000"), Decimal("6.90")),
+    ],
+    DeliveryType.STATION: [
+        (Decimal("500"), Decimal("7.00")),
+        (Decimal("1000"), Decimal("8.50")),
+        (Decimal("2000"), Decimal("9.90")),
+    ],
+}
+
+DELIVERY_RATES_VERSION_KEY = "product:delivery_rates:version"
+
+# This process's copy of the rate table and the version it was loaded at
+_delivery_rates = {"version": None, "table": None}
+
+
+class DeliveryRateQuerySet(models.QuerySet):
+    def rate_table(self):
+        """
+        The rate table as {delivery_type: [(max_weight, cost), ...]}.
+
+        Types without rows in the DeliveryRate table use the default rates.
+        The table is kept in process memory and only reloaded when the
+        version stored in the shared cache changes, which happens whenever
+        rates are written.
+        """
+        version = cache.get(DELIVERY_RATES_VERSION_KEY)
+        if version is None:
+            version = self.bump_version()
+        if _delivery_rates["version"] != version:
+            table = {}
+            for rate in self.model.objects.order_by("delivery_type", "max_weight"):
+                table.setdefault(rate.delivery_type, []).append(
+                    (rate.max_weight, rate.cost)
+                )
+            _delivery_rates.update(
+                version=version, table={**DEFAULT_DELIVERY_RATES, **table}
+            )
+        return _delivery_rates["table"]
+
+    def bump_version(self):
+        version = time.time_ns()
+        cache.set(DELIVERY_RATES_VERSION_KEY, version, None)
+        return version
+
+    # Bulk writes skip the model signals, so they bump the version themselves
+
+    def update(self, **kwargs):
+        result = super().update(**kwargs)
+        transaction.on_commit(self.bump_version)
+        return result
+
+    def bulk_create(self, *args, **kwargs):
+        result = super().bulk_create(*args, **kwargs)
+        transaction.on_commit(self.bump_version)
+        return result
+
+    def bulk_update(self, *args, **kwargs):
+        result = super().bulk_update(*args, **kwargs)
+        transaction.on_commit(self.bump_version)
+        return result
+
+    def quote(self, weight, delivery_type):
+        """
+        Cost of delivering weight grams, at the heaviest bracket's cost above it.
+        """
+        brackets = self.rate_table().get(delivery_type)
+        if not brackets:
+            raise ValueError(f"No delivery rates for {delivery_type!r}.")
+        for max_weight, cost in brackets:
+            if weight <= max_weight:
+                return cost
+        return brackets[-1][1]
+
+
+class DeliveryRate(models.Model):
+    delivery_type = models.CharField(max_length=20, choices=DeliveryType.choices)
+    max_weight = models.DecimalField(
+        max_digits=10, decimal_places=2, help_text="Heaviest order in grams."
+    )
+    cost = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DeliveryRateQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["delivery_type", "max_weight"]
+        verbose_name_plural = "Delivery Rates"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["delivery_type", "max_weight"],
+                name="unique_delivery_rate_bracket",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.get_delivery_type_display()} up to {self.max_weight}g"
+
+
+class DeliveryCouriersQuerySet(models.QuerySet):
+    def requote(self, order_ids, batch_size=500):
+        """
+        Requote the latest courier of each order against the current rates.
+
+        Per batch, weights for all orders come from one grouped aggregate,
+        changed costs are written with one bulk UPDATE and copied onto the
+        orders with another. Returns the number of couriers whose cost changed.
+        """
+        order_ids = list(order_ids)
+        return sum(
+            self._requote_batch(order_ids[start : start + batch_size])
+            for start in range(0, len(order_ids), batch_size)
+        )
+
+    def _requote_batch(self, order_ids):
+        latest = {}
+        for courier in self.filter(cart_order__in=order_ids).order_by(
+            "cart_order", "-created_at", "-pk"
+        ):
+            latest.setdefault(courier.cart_order_id, courier)
+        if not latest:
+            return 0
+
+        weights = dict(
+            CartOrder.objects.filter(pk__in=latest)
+            .with_weight()
+            .values_list("pk", "weight")
+        )
+        now = timezone.now()
+        changed = []
+        for order_id, courier in latest.items():
+            cost = DeliveryRate.objects.quote(weights[order_id], courier.delivery_type)
+            if cost != courier.delivery_cost:
+                courier.delivery_cost = cost
+                courier.updated_at = now
+                changed.append(courier)
+
+        with transaction.atomic():
+            self.model.objects.bulk_update(changed, ["delivery_cost", "updated_at"])
+            CartOrder.objects.sync_delivery_cost(
+                [courier.cart_order_id for courier in changed]
+            )
+        return len(changed)
+
+
 class DeliveryCouriers(models.Model):
-    class DeliveryType(models.TextChoices):
-        LOCATION = "location", "Home Location"
-        STATION = "station", "Close Station"
+    DeliveryType = DeliveryType
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     cart_order = models.ForeignKey(CartOrder, on_delete=models.CASCADE)
@@ -91,6 +575,8 @@ class DeliveryCouriers(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DeliveryCouriersQuerySet.as_manager()
+
     class Meta:
         app_label = "carts"
         ordering = ["location"]
@@ -99,27 +585,36 @@ class DeliveryCouriers(models.Model):
     def __str__(self):
         return self.location[:40]
 
+    def save(self, *args, **kwargs):
+        # Quote the cost and copy it onto the order. Orders past payment keep
+        # what they were charged, only a newly added courier is quoted.
+        weight, payment_status = (
+            CartOrder.objects.with_weight()
+            .values_list("weight", "payment_status")
+            .get(pk=self.cart_order_id)
+        )
+        requote = (
+            self._state.adding or payment_status in REQUOTABLE_PAYMENT_STATUSES
+        )
+        if requote:
+            self.delivery_cost = DeliveryRate.objects.quote(weight, self.delivery_type)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if requote:
+                CartOrder.objects.sync_delivery_cost([self.cart_order_id])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            CartOrder.objects.filter(
+                payment_status__in=REQUOTABLE_PAYMENT_STATUSES
+            ).sync_delivery_cost([self.cart_order_id])
+        return result
+
     def calculate_delivery_cost(self):
-        total_weight = Decimal("0.00")
-
-        for item in self.cart_order.orderitem.all():
-            weight = item.product.weight or Decimal("0.00")
-            qty = item.qty or 0
-            total_weight += weight * qty
-
-        if self.delivery_type == self.DeliveryType.LOCATION:
-            if total_weight <= 500:
-                return Decimal("4.50")
-            elif total_weight <= 1000:
-                return Decimal("5.50")
-            elif total_weight <= 2000:
-                return Decimal("6.90")
-        elif self.delivery_type == self.DeliveryType.STATION:
-            if total_weight <= 500:
-                return Decimal("7.00")
-            elif total_weight <= 1000:
-                return Decimal("8.50")
-            elif total_weight <= 2000:
-                return Decimal("9.90")
-
-        return Decimal("0.00")
+        weight = (
+            CartOrder.objects.with_weight()
+            .values_list("weight", flat=True)
+            .get(pk=self.cart_order_id)
+        )
+        return DeliveryRate.objects.quote(weight, self.delivery_type)
@@ -0,0 +1,263 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
+
+# The search index lives in one table outside the ORM: an FTS5 virtual table
+# on SQLite, a tsvector column with a GIN index on PostgreSQL.
+SEARCH_TABLE = "product_search"
+
+# Matches ranked by relevance per query, deeper matches follow in id order
+SEARCH_MAX_RESULTS = 500
+
+# Relative weight of the indexed columns, most relevant first
+SEARCH_COLUMNS = ("product_name", "tags", "details", "condition", "description")
+SQLITE_COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 2.0, 1.0)
+POSTGRES_COLUMN_WEIGHTS = ("A", "B", "C", "C", "D")
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def get_search_connection():
+    from apps.product.models import Product
+
+    return connections[router.db_for_write(Product)]
+
+
+def search_document(product):
+    """
+    Text indexed for a product, one entry per SEARCH_COLUMNS column.
+    """
+    details = product.details
+    if isinstance(details, (list, tuple)):
+        details = " ".join(str(detail) for detail in details)
+    return (
+        product.product_name,
+        " ".join(tag.name for tag in product.tags.all()),
+        str(details or ""),
+        product.condition,
+        product.description,
+    )
+
+
+class SQLiteSearchBackend:
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"{', '.join(SEARCH_COLUMNS)}, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def remove(self, cursor, product_ids):
+        cursor.executemany(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+            [(pk,) for pk in product_ids],
+        )
+
+    def index(self, cursor, documents):
+        self.remove(cursor, list(documents))
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(SEARCH_COLUMNS))})",
+            [(pk, *document) for pk, document in documents.items()],
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    def is_empty(self, cursor):
+        cursor.execute(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")
+        return cursor.fetchone() is None
+
+    def match_sql(self, tokens):
+        # Quoted prefix terms, so user input never reaches the FTS5 syntax
+        match = " ".join(f'"{token}"*' for token in tokens)
+        return (
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+            [match],
+        )
+
+    def ranked_ids(self, cursor, tokens, within_sql, within_params, limit):
+        sql, params = self.match_sql(tokens)
+        weights = ", ".join(str(weight) for weight in SQLITE_COLUMN_WEIGHTS)
+        cursor.execute(
+            f"{sql} AND rowid IN ({within_sql}) "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s",
+            [*params, *within_params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            "product_id bigint PRIMARY KEY, document tsvector NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx "
+            f"ON {SEARCH_TABLE} USING GIN (document)"
+        )
+
+    def remove(self, cursor, product_ids):
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE product_id = ANY(%s)",
+            [list(product_ids)],
+        )
+
+    def index(self, cursor, documents):
+        vector = " || ".join(
+            f"setweight(to_tsvector('simple', %s), '{weight}')"
+            for weight in POSTGRES_COLUMN_WEIGHTS
+        )
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (product_id, document) "
+            f"VALUES (%s, {vector}) "
+            "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+            [(pk, *document) for pk, document in documents.items()],
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {SEARCH_TABLE}")
+
+    def is_empty(self, cursor):
+        cursor.execute(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")
+        return cursor.fetchone() is None
+
+    @staticmethod
+    def tsquery(tokens):
+        return " & ".join(f"{token}:*" for token in tokens)
+
+    def match_sql(self, tokens):
+        return (
+            f"SELECT product_id FROM {SEARCH_TABLE} "
+            "WHERE document @@ to_tsquery('simple', %s)",
+            [self.tsquery(tokens)],
+        )
+
+    def ranked_ids(self, cursor, tokens, within_sql, within_params, limit):
+        cursor.execute(
+            f"SELECT product_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+            f"WHERE document @@ query AND product_id IN ({within_sql}) "
+            "ORDER BY ts_rank_cd(document, query) DESC, product_id LIMIT %s",
+            [self.tsquery(tokens), *within_params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+SEARCH_BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_search_backend(connection=None):
+    """
+    Search backend for the database products are stored in, or None when
+    that database has no full-text support and search falls back to icontains.
+    """
+    connection = connection or get_search_connection()
+    backend_class = SEARCH_BACKENDS.get(connection.vendor)
+    return backend_class() if backend_class else None
+
+
+def create_search_index(using=None, **kwargs):
+    """
+    Create the index table after migrate, filling it on first creation so
+    search works right after a deploy.
+    """
+    connection = connections[using] if using else get_search_connection()
+    backend = get_search_backend(connection)
+    if backend is None or connection != get_search_connection():
+        return
+    with connection.cursor() as cursor:
+        backend.create_index(cursor)
+        empty = backend.is_empty(cursor)
+    if empty:
+        rebuild_search_index()
+
+
+def index_products(product_ids):
+    """
+    Reindex the given products, removing the ones that no longer exist.
+    """
+    from apps.product.models import Product
+
+    backend = get_search_backend()
+    if backend is None or not product_ids:
+        return 0
+
+    products = Product.objects.filter(pk__in=product_ids).prefetch_related("tags")
+    documents = {product.pk: search_document(product) for product in products}
+    with get_search_connection().cursor() as cursor:
+        backend.remove(cursor, set(product_ids) - set(documents))
+        if documents:
+            backend.index(cursor, documents)
+    return len(documents)
+
+
+def remove_products(product_ids):
+    backend = get_search_backend()
+    if backend and product_ids:
+        with get_search_connection().cursor() as cursor:
+            backend.remove(cursor, product_ids)
+
+
+def rebuild_search_index(batch_size=500):
+    """
+    Recreate the whole index from the product table, batch_size at a time.
+    """
+    from apps.product.models import Product
+
+    backend = get_search_backend()
+    if backend is None:
+        return 0
+
+    with get_search_connection().cursor() as cursor:
+        backend.create_index(cursor)
+        backend.clear(cursor)
+
+    product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(product_ids), batch_size):
+        index_products(product_ids[start : start + batch_size])
+    return len(product_ids)
+
+
+def search_products(queryset, query, limit=None):
+    """
+    Narrow a product queryset to the matches for query, best match first.
+
+    Every match is kept, so counts and facets stay exact. The best `limit`
+    matches of the queryset are ordered by relevance, the rest follow by id.
+    Returns None when full-text search is not available for the database or
+    its index has not been built yet.
+    """
+    backend = get_search_backend()
+    if backend is None:
+        return None
+
+    tokens = TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return queryset
+
+    # Rank only inside the filtered queryset, so filters never push its
+    # matches out of the ranked window
+    within_sql, within_params = queryset.order_by().values("pk").query.sql_with_params()
+    with get_search_connection().cursor() as cursor:
+        if backend.is_empty(cursor):
+            return None
+        product_ids = backend.ranked_ids(
+            cursor, tokens, within_sql, within_params, limit or SEARCH_MAX_RESULTS
+        )
+    if not product_ids:
+        return queryset.none()
+
+    match_sql, match_params = backend.match_sql(tokens)
+    return queryset.filter(pk__in=RawSQL(match_sql, match_params)).order_by(
+        Case(
+            *[When(pk=pk, then=position) for position, pk in enumerate(product_ids)],
+            default=Value(len(product_ids)),
+            output_field=IntegerField(),
+        ),
+        "pk",
+    )
@@ -59,6 +59,7 @@ class ProductSerializer(serializers.ModelSerializer):
         allow_empty=True,
         required=False,
     )
+    in_wishlist = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -83,10 +84,15 @@ class ProductSerializer(serializers.ModelSerializer):
             "hover_image_url",
             "multi_images",
             "uploaded_images",
+            "in_wishlist",
             "created_at",
             "updated_at",
         ]
 
+    def get_in_wishlist(self, obj):
+        # Annotated by ProductViewSet for signed-in users
+        return getattr(obj, "in_wishlist", False)
+
     def create(self, validated_data):
         tags = validated_data.pop("tags", [])
         uploaded_images = validated_data.pop("uploaded_images")
@@ -119,9 +125,38 @@ class ProductSerializer(serializers.ModelSerializer):
         return instance
 
 
-class DeliveryCouriersSerializer(serializers.ModelSerializer):
-    delivery_cost = serializers.SerializerMethodField()
+class ProductCardSerializer(serializers.ModelSerializer):
+    """
+    Compact product projection for cart and wishlist lines.
+
+    Expects multi_images and tags to be prefetched, see
+    ProductLineQuerySet.with_product_card().
+    """
+
+    multi_images = MultiProductImagesSerializer(many=True, read_only=True)
+    tags = TagListField(read_only=True)
 
+    class Meta:
+        model = Product
+        fields = [
+            "id",
+            "product_name",
+            "price",
+            "stock",
+            "is_available",
+            "category",
+            "attributes",
+            "condition",
+            "type",
+            "image_url",
+            "hover_image_url",
+            "multi_images",
+            "tags",
+        ]
+        read_only_fields = fields
+
+
+class DeliveryCouriersSerializer(serializers.ModelSerializer):
     class Meta:
         model = DeliveryCouriers
         fields = [
@@ -134,18 +169,24 @@ class DeliveryCouriersSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
         ]
-
-    def get_delivery_cost(self, obj):
-        return obj.calculate_delivery_cost()
+        read_only_fields = ["delivery_cost"]
 
 
 class DeliveryCouriersCreateSerializer(serializers.ModelSerializer):
-    delivery_cost = serializers.SerializerMethodField()
-
     class Meta:
         model = DeliveryCouriers
         fields = ["delivery_type", "location", "delivery_cost"]
+        # Quoted from the rate table when the courier is saved
+        read_only_fields = ["delivery_cost"]
+
 
-    def get_delivery_cost(self, obj):
-        # Calls the model’s calculate_delivery_cost
-        return obj.calculate_delivery_cost()
+class DeliveryQuoteSerializer(serializers.Serializer):
+    delivery_type = serializers.CharField()
+    label = serializers.CharField()
+    delivery_cost = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class DeliveryRequoteSerializer(serializers.Serializer):
+    orders = serializers.ListField(
+        child=serializers.CharField(), required=False, max_length=1000
+    )
@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from taggit.models import Tag
+
+from apps.product.models import DeliveryRate, Product
+from apps.product.search import index_products, remove_products
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    # Tags are saved after the product, so index once the transaction commits
+    transaction.on_commit(lambda: index_products([instance.pk]))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_product_facets(sender, action="post_save", **kwargs):
+    if action.startswith("post_"):
+        transaction.on_commit(Product.objects.bump_facets_version)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def index_retagged_product(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear") and isinstance(
+        instance, Product
+    ):
+        transaction.on_commit(lambda: index_products([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def remove_deleted_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: remove_products([product_id]))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_retagged_tag_index(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Product):
+        return
+    if action in ("post_add", "post_remove"):
+        tag_names = list(
+            Tag.objects.filter(pk__in=pk_set).values_list("name", flat=True)
+        )
+    elif action == "pre_clear":
+        tag_names = list(instance.tags.values_list("name", flat=True))
+    else:
+        return
+    transaction.on_commit(lambda: Product.objects.invalidate_tag_index(tag_names))
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_deleted_product_tag_index(sender, instance, **kwargs):
+    tag_names = list(instance.tags.values_list("name", flat=True))
+    transaction.on_commit(lambda: Product.objects.invalidate_tag_index(tag_names))
+
+
+@receiver(pre_save, sender=Tag)
+def invalidate_renamed_tag_index(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    old_name = Tag.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+    if old_name is not None and old_name != instance.name:
+        transaction.on_commit(lambda: Product.objects.invalidate_tag_index([old_name]))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_index(sender, instance, **kwargs):
+    tag_names = [instance.name]
+    transaction.on_commit(lambda: Product.objects.invalidate_tag_index(tag_names))
+
+
+@receiver(post_save, sender=DeliveryRate)
+@receiver(post_delete, sender=DeliveryRate)
+def invalidate_delivery_rates(sender, **kwargs):
+    transaction.on_commit(DeliveryRate.objects.bump_version)
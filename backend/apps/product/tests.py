@@ -1,3 +1,458 @@
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from taggit.models import Tag
+
+from apps.carts.models import CartOrder, CartOrderItem, Wishlist
+from apps.category.models import Category
+from apps.common.testing import build_product, make_product, make_superuser, make_user
+from apps.product.models import (
+    DeliveryCouriers,
+    DeliveryRate,
+    MultiProductImages,
+    Product,
+)
+
+
+class DeliveryQuoteTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.order = CartOrder.objects.create(
+            user=self.user,
+            full_name="Test User",
+            email="buyer@example.com",
+            mobile="0700000000",
+        )
+        for i in range(5):
+            product = make_product(f"Product {i}", weight=100)
+            CartOrderItem.objects.create(
+                order=self.order, product=product, qty=2, price=10
+            )
+        self.url = reverse("delivery-quote", args=[self.order.oid])
+
+    def test_quotes_every_delivery_type_in_one_query(self):
+        # Warm this process's copy of the rate table
+        DeliveryRate.objects.rate_table()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data["weight"], 1000)
+        self.assertEqual(
+            {q["delivery_type"]: q["delivery_cost"] for q in response.data["quotes"]},
+            {"location": "5.50", "station": "8.50"},
+        )
+
+    def test_rate_changes_are_picked_up(self):
+        self.client.get(self.url)
+        # The rate is rolled back after the test, make other tests reload
+        self.addCleanup(DeliveryRate.objects.bump_version)
+        with self.captureOnCommitCallbacks(execute=True):
+            DeliveryRate.objects.create(
+                delivery_type="location", max_weight=5000, cost="3.00"
+            )
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.data["quotes"][0]["delivery_cost"], "3.00")
+        # Types without rates in the table keep the default rates
+        self.assertEqual(response.data["quotes"][1]["delivery_cost"], "8.50")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DeliveryRate.objects.update(cost="4.00")
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["quotes"][0]["delivery_cost"], "4.00")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DeliveryRate.objects.all().delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["quotes"][0]["delivery_cost"], "5.50")
+
+    def test_weights_above_the_heaviest_bracket_are_not_free(self):
+        self.assertEqual(
+            DeliveryRate.objects.quote(Decimal("5000"), "location"), Decimal("6.90")
+        )
+        with self.assertRaises(ValueError):
+            DeliveryRate.objects.quote(Decimal("100"), "drone")
+
+    def test_courier_cost_uses_the_order_weight(self):
+        courier = DeliveryCouriers.objects.create(
+            user=self.user, cart_order=self.order, location="Home"
+        )
+
+        self.assertEqual(courier.delivery_cost, 5.5)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.grand_total, 105.5)
+
+    def test_requote_many_orders(self):
+        DeliveryCouriers.objects.create(
+            user=self.user, cart_order=self.order, location="Home"
+        )
+        self.addCleanup(DeliveryRate.objects.bump_version)
+        with self.captureOnCommitCallbacks(execute=True):
+            DeliveryRate.objects.create(
+                delivery_type="location", max_weight=5000, cost="3.00"
+            )
+        admin = make_superuser()
+        self.client.force_authenticate(admin)
+
+        response = self.client.post(reverse("delivery-requote"), {}, format="json")
+
+        self.assertEqual(response.data, {"orders": 1, "requoted": 1})
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.delivery_cost, self.order.grand_total), (3, 103))
+        # Nothing changed since, so a second run writes nothing
+        response = self.client.post(
+            reverse("delivery-requote"), {"orders": [self.order.oid]}, format="json"
+        )
+        self.assertEqual(response.data["requoted"], 0)
+
+    def test_requote_skips_paid_orders_even_when_listed(self):
+        DeliveryCouriers.objects.create(
+            user=self.user, cart_order=self.order, location="Home"
+        )
+        CartOrder.objects.filter(pk=self.order.pk).update(payment_status="paid")
+        self.addCleanup(DeliveryRate.objects.bump_version)
+        with self.captureOnCommitCallbacks(execute=True):
+            DeliveryRate.objects.create(
+                delivery_type="location", max_weight=5000, cost="3.00"
+            )
+        admin = make_superuser()
+        self.client.force_authenticate(admin)
+
+        response = self.client.post(
+            reverse("delivery-requote"), {"orders": [self.order.oid]}, format="json"
+        )
+        self.assertEqual(response.data, {"orders": 0, "requoted": 0})
+
+        call_command("requote_deliveries", orders=[self.order.oid], stdout=StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.delivery_cost, 5.5)
+
+
+class ProductWishlistTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.products = [make_product(f"Product {i}") for i in range(3)]
+
+    def test_products_are_marked_in_wishlist(self):
+        Wishlist.objects.create(user=self.user, product=self.products[1])
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse("product-list"))
+
+        marked = {row["id"] for row in response.data["results"] if row["in_wishlist"]}
+        self.assertEqual(marked, {self.products[1].pk})
+
+    def test_wishlist_ids_follow_toggles(self):
+        self.client.force_authenticate(self.user)
+        url = reverse("customer-wishlist-ids")
+        self.assertEqual(self.client.get(url).data["product_ids"], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for product in self.products[:2]:
+                self.client.post(
+                    reverse("customer-wishlist-create"), {"product_id": product.pk}
+                )
+        self.assertEqual(
+            sorted(self.client.get(url).data["product_ids"]),
+            [product.pk for product in self.products[:2]],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("customer-wishlist-create"),
+                {"product_id": self.products[0].pk},
+            )
+
+        self.assertEqual(
+            self.client.get(url).data["product_ids"], [self.products[1].pk]
+        )
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data["product_ids"], [self.products[1].pk])
+        self.assertEqual(Wishlist.objects.filter(user=self.user).count(), 1)
+
+
+class ProductSearchTests(APITestCase):
+    def create_product(self, name, description="Description", tags=()):
+        product = make_product(name, description=description)
+        product.tags.add(*tags)
+        return product
+
+    def search(self, query):
+        response = self.client.get(reverse("product-list"), {"search": query})
+        return [row["id"] for row in response.data["results"]]
+
+    def test_search_is_ranked_and_follows_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jacket = self.create_product("Denim jacket", tags=["outerwear"])
+            described = self.create_product("Shirt", description="Goes with denim")
+            self.create_product("Wool scarf")
+
+        # A match in the name outranks a match in the description
+        self.assertEqual(self.search("denim"), [jacket.pk, described.pk])
+        self.assertEqual(self.search("outer"), [jacket.pk])
+        self.assertEqual(self.search('"denim*'), [jacket.pk, described.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            jacket.product_name = "Leather jacket"
+            jacket.save()
+            described.delete()
+        self.assertEqual(self.search("denim"), [])
+        self.assertEqual(self.search("leather outerwear"), [jacket.pk])
+
+    def test_filtered_matches_are_not_cut_by_the_ranking_limit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                self.create_product(f"Denim jacket {i}")
+            shirt = self.create_product("Shirt", description="Goes with denim")
+        shirt.type = "wo"
+        shirt.save(update_fields=["type"])
+
+        with mock.patch("apps.product.search.SEARCH_MAX_RESULTS", 1):
+            response = self.client.get(
+                reverse("product-list"), {"search": "denim", "type": "wo"}
+            )
+            self.assertEqual(
+                [row["id"] for row in response.data["results"]], [shirt.pk]
+            )
+            response = self.client.get(reverse("product-list"), {"search": "denim"})
+        self.assertEqual(response.data["count"], 4)
+
+    def test_empty_index_falls_back_to_icontains(self):
+        # Products created before the index existed, as right after a deploy
+        product = Product.objects.bulk_create([build_product("Denim jacket")])[0]
+        self.assertEqual(self.search("denim"), [product.pk])
+
+    def test_rebuild_indexes_bulk_created_products(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product("Wool scarf")
+        Product.objects.bulk_create(
+            [build_product(f"Linen shirt {i}", material="Linen") for i in range(3)]
+        )
+        self.assertEqual(self.search("linen"), [])
+
+        call_command("rebuild_search_index", batch_size=2, stdout=StringIO())
+
+        self.assertEqual(len(self.search("linen")), 3)
+
+
+class ProductFacetsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Jackets")
+        for i, (condition, price) in enumerate(
+            [("New", 20), ("New", 120), ("Use", 60), ("Other", 600)]
+        ):
+            product = make_product(
+                f"Product {i}",
+                condition=condition,
+                price=price,
+                category=self.category if i < 2 else None,
+            )
+            product.tags.add("summer", *(["sale"] if i % 2 else []))
+
+    def facets(self, params=None):
+        return self.client.get(reverse("product-facets"), params or {}).data
+
+    def test_facets_are_counted_for_the_filter_selection(self):
+        facets = self.facets()
+
+        self.assertEqual(
+            {row["value"]: row["count"] for row in facets["condition"]},
+            {"New": 2, "Use": 1, "Other": 1},
+        )
+        self.assertEqual(
+            facets["category"],
+            [{"value": self.category.pk, "label": "Jackets", "count": 2}],
+        )
+        self.assertEqual(
+            [(row["value"], row["count"]) for row in facets["tags"]],
+            [("summer", 4), ("sale", 2)],
+        )
+        self.assertEqual([row["count"] for row in facets["price"]], [1, 1, 1, 0, 1, 0])
+
+        facets = self.facets({"tags": "sale", "price_max": 200})
+        self.assertEqual(
+            {row["value"]: row["count"] for row in facets["condition"]}, {"New": 1}
+        )
+        self.assertEqual(
+            [(row["value"], row["count"]) for row in facets["tags"]],
+            [("sale", 1), ("summer", 1)],
+        )
+
+    def test_facets_are_cached_until_a_product_changes(self):
+        self.facets({"condition": "New", "page": 1})
+        with self.assertNumQueries(0):
+            facets = self.facets({"page": 2, "condition": "New"})
+        self.assertEqual(facets["type"][0]["count"], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(condition="Use")
+            product.condition = "New"
+            product.save()
+
+        self.assertEqual(self.facets({"condition": "New"})["type"][0]["count"], 3)
+
+
+class ProductAttributeFilterTests(APITestCase):
+    def create_product(self, name, attributes):
+        return make_product(name, attributes=attributes)
+
+    def filter(self, attributes):
+        response = self.client.get(reverse("product-list"), {"attributes": attributes})
+        return sorted(row["id"] for row in response.data["results"])
+
+    def test_attribute_filters_intersect_the_side_table(self):
+        red_m = self.create_product("Red M", {"color": "red", "size": ["M", "L"]})
+        red_s = self.create_product("Red S", {"color": "red", "size": "S"})
+        self.create_product("Blue M", {"color": "blue", "size": "M"})
+
+        self.assertEqual(self.filter("color:red"), [red_m.pk, red_s.pk])
+        self.assertEqual(self.filter("color:red,size:M"), [red_m.pk])
+
+        red_m.attributes = {"color": "green", "size": "M"}
+        red_m.save()
+        self.assertEqual(self.filter("color:red"), [red_s.pk])
+
+    def test_attributes_edited_in_place_are_synced(self):
+        product = self.create_product("Shirt", {"color": "red"})
+        product = Product.objects.get(pk=product.pk)
+
+        product.attributes["color"] = "blue"
+        product.save()
+        self.assertEqual(self.filter("color:blue"), [product.pk])
+
+        product.attributes["color"] = "green"
+        product.save()
+        self.assertEqual(self.filter("color:blue"), [])
+        self.assertEqual(self.filter("color:green"), [product.pk])
+
+    def test_backfill_syncs_attributes_written_without_save(self):
+        product = self.create_product("Shirt", {})
+        Product.objects.filter(pk=product.pk).update(
+            attributes={"fit": "slim", "organic": True}
+        )
+        self.assertEqual(self.filter("fit:slim"), [])
+
+        call_command("backfill_product_attributes", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(self.filter("fit:slim,organic:true"), [product.pk])
+
+
+class ProductTagIndexTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = []
+        for i, tags in enumerate([["summer", "sale"], ["summer"], ["winter"]]):
+            product = make_product(f"Product {i}")
+            product.tags.add(*tags)
+            self.products.append(product)
+
+    def filter(self, **params):
+        response = self.client.get(reverse("product-list"), params)
+        return sorted(row["id"] for row in response.data["results"])
+
+    def test_tags_match_any_or_all(self):
+        first, second, third = (product.pk for product in self.products)
+
+        self.assertEqual(self.filter(tags="sale,winter"), [first, third])
+        self.assertEqual(self.filter(tags_all="summer,sale"), [first])
+        self.assertEqual(self.filter(tags_all="sale,winter"), [])
+
+    def test_index_is_cached_and_dropped_on_change(self):
+        first, second, third = self.products
+        self.assertEqual(
+            Product.objects.tagged_ids(["summer", "winter"]),
+            {"summer": [first.pk, second.pk], "winter": [third.pk]},
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            third.tags.add("summer")
+            first.tags.remove("summer")
+            second.tags.clear()
+
+        with self.assertNumQueries(1):
+            index = Product.objects.tagged_ids(["summer", "winter"])
+        self.assertEqual(index, {"summer": [third.pk], "winter": [third.pk]})
+        with self.assertNumQueries(0):
+            Product.objects.tagged_ids(["summer", "winter"])
+
+    def test_renamed_tags_leave_no_stale_entry(self):
+        third = self.products[2]
+        Product.objects.tagged_ids(["winter", "cold"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.get(name="winter")
+            tag.name = "cold"
+            tag.save()
+
+        self.assertEqual(
+            Product.objects.tagged_ids(["winter", "cold"]),
+            {"winter": [], "cold": [third.pk]},
+        )
+
+    def test_large_selections_are_filtered_with_a_subquery(self):
+        first, second, third = (product.pk for product in self.products)
+
+        with mock.patch("apps.product.models.TAG_INDEX_MAX_IDS", 0):
+            self.assertEqual(self.filter(tags="sale,winter"), [first, third])
+            self.assertEqual(self.filter(tags_all="summer,sale"), [first])
+
+
+class ProductQueryBudgetTests(APITestCase):
+    """
+    Product endpoints must run a fixed number of queries whatever the page
+    size. Raise a budget only together with the code that needs it.
+    """
+
+    LIST_BUDGET = 4  # count, page, multi_images, tags
+    DETAIL_BUDGET = 3  # product, multi_images, tags
+
+    def setUp(self):
+        self.user = make_user()
+
+    def create_products(self, count):
+        for i in range(count):
+            product = make_product(f"Product {i}")
+            product.tags.add("summer", f"tag-{i}")
+            MultiProductImages.objects.create(product=product)
+            Wishlist.objects.create(user=self.user, product=product)
+        return product
+
+    def assert_list_budget(self):
+        for user in (None, self.user):
+            self.client.force_authenticate(user)
+            with self.assertNumQueries(self.LIST_BUDGET):
+                response = self.client.get(reverse("product-list"))
+            self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_budget_does_not_grow_with_the_page(self):
+        self.create_products(2)
+        self.assert_list_budget()
+
+        self.create_products(10)
+        response = self.assert_list_budget()
+
+        row = response.data["results"][0]
+        self.assertEqual(len(row["multi_images"]), 1)
+        self.assertIn("summer", row["tags"])
+        self.assertTrue(row["in_wishlist"])
+
+    def test_detail_budget(self):
+        product = self.create_products(1)
+
+        for user in (None, self.user):
+            self.client.force_authenticate(user)
+            with self.assertNumQueries(self.DETAIL_BUDGET):
+                response = self.client.get(reverse("product-detail", args=[product.pk]))
+            self.assertEqual(response.data["tags"], ["summer", "tag-0"])
@@ -18,5 +18,15 @@ urlpatterns = [
         views.DeliveryCourierCreateView.as_view(),
         name="delivery-create-by-order",
     ),
+    path(
+        "delivery/requote/",
+        views.DeliveryRequoteView.as_view(),
+        name="delivery-requote",
+    ),
+    path(
+        "delivery/quote/<str:order_oid>/",
+        views.DeliveryQuoteView.as_view(),
+        name="delivery-quote",
+    ),
     path("", include(router.urls)),
 ]
@@ -1,19 +1,32 @@
 from apps.carts.models import CartOrder
+from django.core.cache import cache
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, permissions, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound
-from rest_framework.filters import SearchFilter
 from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.response import Response
 
-from .filters import ProductFilter
-from .models import Brand, DeliveryCouriers, Product
+from .filters import ProductFilter, ProductSearchFilter, product_filter_signature
+from .models import (
+    PRODUCT_FACETS_CACHE_TIMEOUT,
+    REQUOTABLE_PAYMENT_STATUSES,
+    Brand,
+    DeliveryCouriers,
+    DeliveryRate,
+    DeliveryType,
+    Product,
+    product_facets_cache_key,
+)
 from .pagination import CustomPageNumberPagination, ProductPageNumberPagination
 from .serializers import (
     BrandSerializer,
     DeliveryCouriersCreateSerializer,
     DeliveryCouriersSerializer,
+    DeliveryQuoteSerializer,
+    DeliveryRequoteSerializer,
     ProductSerializer,
 )
 from .tasks import process_new_product
@@ -31,7 +44,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     parser_classes = [MultiPartParser, FormParser]
     pagination_class = ProductPageNumberPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter]
     filterset_class = ProductFilter
     search_fields = [
         "product_name",
@@ -41,10 +54,29 @@ class ProductViewSet(viewsets.ModelViewSet):
         "description",
     ]
 
+    def get_queryset(self):
+        return super().get_queryset().for_catalog(self.request.user)
+
     def perform_create(self, serializer):
         product = serializer.save()
         process_new_product.delay(product.id)
 
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        """
+        Sidebar counts for the current filter selection, cached per selection.
+        """
+        key = product_facets_cache_key(
+            product_filter_signature(
+                request.query_params, ProductSearchFilter.search_param
+            )
+        )
+        facets = cache.get(key)
+        if facets is None:
+            facets = self.filter_queryset(self.get_queryset()).facets()
+            cache.set(key, facets, PRODUCT_FACETS_CACHE_TIMEOUT)
+        return Response(facets)
+
 
 class DeliveryCourierCreateView(generics.CreateAPIView):
     serializer_class = DeliveryCouriersCreateSerializer
@@ -58,16 +90,61 @@ class DeliveryCourierCreateView(generics.CreateAPIView):
         order = get_object_or_404(
             CartOrder, oid=self.kwargs["order_oid"], user=self.request.user
         )
-        delivery = serializer.save(user=self.request.user, cart_order=order)
+        # Saving quotes the delivery cost and updates the order's grand total
+        serializer.save(user=self.request.user, cart_order=order)
+
+
+class DeliveryQuoteView(generics.GenericAPIView):
+    """
+    Delivery cost of an order for every delivery type at once.
+    """
+
+    serializer_class = DeliveryQuoteSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, order_oid):
+        # One query for the order weight, the rates come from memory
+        weight = get_object_or_404(
+            CartOrder.objects.with_weight().values_list("weight", flat=True),
+            oid=order_oid,
+            user=request.user,
+        )
+        quotes = [
+            {
+                "delivery_type": delivery_type.value,
+                "label": delivery_type.label,
+                "delivery_cost": DeliveryRate.objects.quote(weight, delivery_type),
+            }
+            for delivery_type in DeliveryType
+        ]
+        serializer = self.get_serializer(quotes, many=True)
+        return Response({"weight": weight, "quotes": serializer.data})
+
+
+class DeliveryRequoteView(generics.GenericAPIView):
+    """
+    Requote the delivery cost of many orders after rates change.
 
-        # Calculate and update the delivery cost
-        delivery_cost = delivery.calculate_delivery_cost()
-        delivery.delivery_cost = delivery_cost
-        delivery.save(update_fields=["delivery_cost"])
+    Requotes every unpaid order, or only the unpaid ones among a given list
+    of order oids.
+    """
+
+    serializer_class = DeliveryRequoteSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        orders = CartOrder.objects.filter(
+            payment_status__in=REQUOTABLE_PAYMENT_STATUSES
+        )
+        if "orders" in serializer.validated_data:
+            orders = orders.filter(oid__in=serializer.validated_data["orders"])
+        order_ids = list(orders.order_by("pk").values_list("pk", flat=True))
 
-        # Update the CartOrder total
-        order.total += delivery_cost
-        order.save(update_fields=["total"])
+        requoted = DeliveryCouriers.objects.requote(order_ids)
+        return Response({"orders": len(order_ids), "requoted": requoted})
 
 
 class DeliveryCourierDetailView(generics.RetrieveAPIView):
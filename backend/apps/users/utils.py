@@ -12,6 +12,8 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from apps.common.utils import queue_email
+
 User = get_user_model()
 
 
@@ -109,6 +111,4 @@ def send_email_notification(request, user, email_subject, email_template, link=N
         to=[user.email],
     )
     email.content_subtype = "html"  # Send as HTML email
-    email.send()
-
-    print(f"Sent email to {user.email} with subject: {email_subject}")
+    queue_email(email)
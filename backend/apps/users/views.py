@@ -9,7 +9,12 @@ from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from rest_framework import generics, status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+from apps.carts.guest import GuestCart
+from apps.carts.models import Cart
 
 from .serializers import CustomRegisterSerializer, UserSerializer
 from .utils import send_email_notification
@@ -29,6 +34,24 @@ class CustomUserDetailsView(generics.RetrieveUpdateAPIView):
         return get_user_model().objects.none()
 
 
+class LoginView(TokenObtainPairView):
+    """
+    Obtain a token pair, merging the visitor's guest cart into their cart.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        guest_cart_id = request.data.get("guest_cart_id")
+        if guest_cart_id:
+            Cart.objects.merge_guest_cart(serializer.user, GuestCart(guest_cart_id))
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
 class UserRegisterAPIView(generics.ListCreateAPIView):
     queryset = User.objects.all()
     serializer_class = CustomRegisterSerializer
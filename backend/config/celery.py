@@ -18,6 +18,8 @@ app.autodiscover_tasks()
 # This helps with apps not following default structure
 try:
     import apps.product.tasks
+    import apps.carts.tasks
+    import apps.common.tasks
 except ImportError:
     pass  # Log or raise if needed
 
@@ -3,6 +3,8 @@ from datetime import timedelta
 from os import getenv, path
 from pathlib import Path
 
+from celery.schedules import crontab
+
 
 ROOT_DIR = Path(__file__).resolve().parent.parent.parent
 BASE_DIR = ROOT_DIR / "apps"
@@ -139,6 +141,52 @@ SIMPLE_JWT = {
 SITE_ID = 1
 PAYPAL_CLIENT_ID = os.getenv("CLIENT_ID")
 PAYPAL_SECRET_ID = os.getenv("SECRET_KEY")
+PAYPAL_API_BASE = os.getenv("PAYPAL_API_BASE", "https://api-m.sandbox.paypal.com")
+# (connect, read) timeouts in seconds for every PayPal API call
+PAYPAL_TIMEOUT = (3.05, 10)
+PAYPAL_MAX_RETRIES = 2
+# Verify payments in a Celery worker and answer payment-success with a 202
+PAYPAL_VERIFY_ASYNC = os.getenv("PAYPAL_VERIFY_ASYNC", "False") == "True"
+# Id of the webhook registered in the PayPal dashboard, used to verify events
+PAYPAL_WEBHOOK_ID = os.getenv("PAYPAL_WEBHOOK_ID")
+# How long checkout holds stock for an unpaid order
+STOCK_RESERVATION_TTL = timedelta(
+    minutes=int(os.getenv("STOCK_RESERVATION_TTL_MINUTES", 30))
+)
+# Cart lines not added to or changed for this long are swept, and archived
+# first if enabled
+ABANDONED_CART_MAX_AGE = timedelta(
+    days=int(os.getenv("ABANDONED_CART_MAX_AGE_DAYS", 30))
+)
+ABANDONED_CART_ARCHIVE = os.getenv("ABANDONED_CART_ARCHIVE", "True") == "True"
+# Anonymous carts live in the cache for this long after their last change
+GUEST_CART_TTL = timedelta(days=int(os.getenv("GUEST_CART_TTL_DAYS", 7)))
+# Caps on the products in a guest cart and the quantity of each
+GUEST_CART_MAX_LINES = int(os.getenv("GUEST_CART_MAX_LINES", 50))
+GUEST_CART_MAX_QTY = int(os.getenv("GUEST_CART_MAX_QTY", 99))
+# Periodic tasks, shared by every environment that runs celery beat
+CELERY_BEAT_SCHEDULE = {
+    "release-expired-stock-reservations": {
+        "task": "apps.carts.tasks.release_expired_reservations",
+        "schedule": 60.0,
+    },
+    "process-paypal-webhook-events": {
+        "task": "apps.carts.tasks.process_paypal_webhook_events",
+        "schedule": 10.0,
+    },
+    "rebuild-sales-rollup": {
+        "task": "apps.carts.tasks.rebuild_sales_rollup",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "sweep-abandoned-carts": {
+        "task": "apps.carts.tasks.sweep_abandoned_carts",
+        "schedule": crontab(hour=4, minute=0),
+    },
+    "send-queued-emails": {
+        "task": "apps.common.tasks.send_queued_emails",
+        "schedule": 10.0,
+    },
+}
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -35,6 +35,21 @@ DEFAULT_FROM_EMAIL = getenv("DEFAULT_FROM_EMAIL", "webmaster@chiqfrip.hzcitycent
 # Maximum file upload size (1MB)
 MAX_UPLOAD_SIZE = 1 * 1024 * 1024
 
+# Shared cache for every worker: guest carts, cart summaries and PayPal tokens
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": getenv("REDIS_URL", "redis://localhost:6379/1"),
+    }
+}
+
+# Celery workers and beat, the schedule itself lives in base.py
+CELERY_BROKER_URL = getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
+CELERY_ACCEPT_CONTENT = ["json"]
+CELERY_TASK_SERIALIZER = "json"
+CELERY_TIMEZONE = "UTC"
+
 # Trusted origins for CSRF protection
 CSRF_TRUSTED_ORIGINS = [
     "https://chiqfrip.hzcitycenter.com",